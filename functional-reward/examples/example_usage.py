@@ -1,6 +1,7 @@
 """Example usage of Anthropic LLM helper functions."""
 
 import asyncio
+import functools
 import sys
 from pathlib import Path
 
@@ -23,6 +24,7 @@ class SearchSuggestion(BaseModel):
     reasoning: str
 
 
+@functools.lru_cache(maxsize=64)
 def create_solid_color_png(r: int, g: int, b: int, size: int = 100) -> bytes:
     """Create a solid color PNG image programmatically."""
     import struct
@@ -39,10 +41,8 @@ def create_solid_color_png(r: int, g: int, b: int, size: int = 100) -> bytes:
     ihdr_data = struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)
     ihdr = png_chunk(b"IHDR", ihdr_data)
 
-    raw_data = b""
-    for _ in range(height):
-        raw_data += b"\x00"
-        raw_data += bytes([r, g, b]) * width
+    row = b"\x00" + bytes((r, g, b)) * width
+    raw_data = row * height
     compressed = zlib.compress(raw_data, 9)
     idat = png_chunk(b"IDAT", compressed)
     iend = png_chunk(b"IEND", b"")
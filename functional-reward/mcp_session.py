@@ -0,0 +1,164 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+# All rights reserved.
+#
+# This source code is licensed under the BSD-style license found in the
+# LICENSE file in the root directory of this source tree.
+
+"""
+Persistent MCP client session.
+
+Spawning the stdio MCP server and running the protocol handshake costs
+hundreds of milliseconds; keeping one session open amortizes that across
+every tool call made by the environment.
+"""
+
+import asyncio
+import threading
+import weakref
+from typing import Any
+
+from mcp import ClientSession, StdioServerParameters
+from mcp.client.stdio import stdio_client
+
+# How long shutdown waits for the server process to exit before giving up
+SHUTDOWN_TIMEOUT = 10.0
+
+
+class PersistentMCPSession:
+    """
+    A long-lived MCP ClientSession driven by a dedicated event loop thread.
+
+    The session is opened lazily on the first call and reopened after a
+    failed call. close(), leaving a ``with`` block, or garbage collection
+    shuts the server down. Tool calls can be made from synchronous code via
+    call_tool()/call_tools() or from any event loop via call_tool_async()/call_tools_async().
+
+    Example:
+        >>> with PersistentMCPSession(StdioServerParameters(command="node", args=["index.js"])) as mcp:
+        ...     result = mcp.call_tool("audit_with_lighthouse", {})
+    """
+
+    def __init__(self, server_params: StdioServerParameters):
+        self.server_params = server_params
+        # Everything the loop thread touches lives on _SessionState, so the
+        # running owner task never keeps this object alive and the finalizer
+        # can shut the server down once it is collected.
+        self._state = _SessionState(server_params)
+        self._finalizer = weakref.finalize(self, self._state.shutdown)
+
+    def call_tool(self, name: str, arguments: dict[str, Any] | None = None) -> Any:
+        """Call an MCP tool, blocking until the result is available."""
+        return self._state.submit(self._state.call_tool(name, arguments or {})).result()
+
+    async def call_tool_async(self, name: str, arguments: dict[str, Any] | None = None) -> Any:
+        """Call an MCP tool from any event loop."""
+        return await asyncio.wrap_future(self._state.submit(self._state.call_tool(name, arguments or {})))
+
+    def call_tools(self, *calls: tuple[str, dict[str, Any]]) -> list[Any]:
+        """Call several MCP tools concurrently, blocking until all results are available."""
+        return self._state.submit(self._state.call_tools(calls)).result()
+
+    async def call_tools_async(self, *calls: tuple[str, dict[str, Any]]) -> list[Any]:
+        """Call several MCP tools concurrently from any event loop."""
+        return await asyncio.wrap_future(self._state.submit(self._state.call_tools(calls)))
+
+    def close(self) -> None:
+        """Shut down the MCP server process and stop the session thread."""
+        self._finalizer()
+
+    def __enter__(self) -> "PersistentMCPSession":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+class _SessionState:
+    """Event loop, thread and server connection behind a PersistentMCPSession."""
+
+    def __init__(self, server_params: StdioServerParameters):
+        self.server_params = server_params
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, name="mcp-session", daemon=True)
+        self.thread.start()
+        self.lock = asyncio.Lock()
+        self.session: ClientSession | None = None
+        self.owner: asyncio.Task | None = None
+        self.closing: asyncio.Event | None = None
+
+    def submit(self, coro) -> "asyncio.Future":
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def shutdown(self) -> None:
+        if self.loop.is_closed():
+            return
+        if threading.current_thread() is self.thread:
+            # Collected on the loop thread itself, which cannot wait for itself
+            self.loop.create_task(self._stop())
+            return
+        try:
+            self.submit(self.disconnect()).result(timeout=SHUTDOWN_TIMEOUT)
+        finally:
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self.thread.join(timeout=SHUTDOWN_TIMEOUT)
+            if not self.thread.is_alive():
+                self.loop.close()
+
+    async def _stop(self) -> None:
+        await self.disconnect()
+        self.loop.stop()
+
+    async def call_tool(self, name: str, arguments: dict[str, Any]) -> Any:
+        session = await self._ensure_session()
+        try:
+            return await session.call_tool(name, arguments=arguments)
+        except Exception:
+            # Drop the session so the next call starts from a fresh server process
+            await self.disconnect()
+            raise
+
+    async def call_tools(self, calls: tuple[tuple[str, dict[str, Any]], ...]) -> list[Any]:
+        session = await self._ensure_session()
+        # Let every call settle before tearing the session down, so one failure
+        # does not kill the others mid-flight
+        results = await asyncio.gather(
+            *(session.call_tool(name, arguments=arguments) for name, arguments in calls),
+            return_exceptions=True,
+        )
+        for result in results:
+            if isinstance(result, BaseException):
+                await self.disconnect()
+                raise result
+        return results
+
+    async def _ensure_session(self) -> ClientSession:
+        async with self.lock:
+            if self.session is None:
+                ready = self.loop.create_future()
+                self.closing = asyncio.Event()
+                self.owner = self.loop.create_task(self._own_session(ready))
+                await ready
+            return self.session
+
+    async def _own_session(self, ready: asyncio.Future) -> None:
+        # stdio_client must be entered and exited by the same task, so a single
+        # task owns the connection for its whole lifetime.
+        try:
+            async with stdio_client(self.server_params) as (read, write):
+                async with ClientSession(read, write) as session:
+                    await session.initialize()
+                    self.session = session
+                    ready.set_result(None)
+                    await self.closing.wait()
+        except Exception as e:
+            if not ready.done():
+                ready.set_exception(e)
+        finally:
+            self.session = None
+
+    async def disconnect(self) -> None:
+        if self.owner is None:
+            return
+        self.closing.set()
+        await asyncio.gather(self.owner, return_exceptions=True)
+        self.owner = None
@@ -1,21 +1,21 @@
 """Data models for WebOpt Environment."""
 
+import json
+from dataclasses import dataclass
 from typing import Any
 
 from PIL import Image
-from pydantic import BaseModel
 
 
-class WebsiteState(BaseModel):
+@dataclass(kw_only=True, slots=True)
+class WebsiteState:
     """State of the website code."""
 
     code: dict[str, str]
 
-    class Config:
-        arbitrary_types_allowed = True
 
-
-class LighthouseScores(BaseModel):
+@dataclass(kw_only=True, slots=True)
+class LighthouseScores:
     """Lighthouse audit scores."""
 
     performance_score: float
@@ -24,7 +24,8 @@ class LighthouseScores(BaseModel):
     practices_score: float
 
 
-class VerificationScores(BaseModel):
+@dataclass(kw_only=True, slots=True)
+class VerificationScores:
     """Verification audit scores."""
 
     psnr_score: float
@@ -32,7 +33,8 @@ class VerificationScores(BaseModel):
     specification_score: float  # Score from rubrique evaluation [0, 1]
 
 
-class WebOptState(BaseModel):
+@dataclass(kw_only=True, slots=True)
+class WebOptState:
     """State of the WebOpt environment."""
 
     site: WebsiteState
@@ -44,27 +46,35 @@ class WebOptState(BaseModel):
     practices_scores: list[float]
     project_path: str
     reference_screenshot: Any | None = None  # PIL Image
+    reference_array: Any | None = None  # pooled np.ndarray of reference_screenshot, cached for PSNR
     reference_spec: str | None = None  # Generated specification text
-
-    class Config:
-        arbitrary_types_allowed = True
+    reference_scoring_prompt: str | None = None  # build_scoring_prompt(reference_spec), built once per episode
+    reference_phash: Any | None = None  # imagehash.ImageHash of reference_screenshot
+    # Latest scores, the baseline for the next step's reward
+    last_performance: float = 0.0
+    last_accessibility: float = 0.0
+    last_seo: float = 0.0
+    last_practices: float = 0.0
 
 
-class WebOptAction(BaseModel):
+@dataclass(kw_only=True, slots=True)
+class WebOptAction:
     """Action to take in the environment."""
 
-    site: WebsiteState | str  # Can be WebsiteState or JSON string
+    site: WebsiteState | dict | str  # WebsiteState, {"code": {...}}, or JSON string of the code dict
 
-    class Config:
-        arbitrary_types_allowed = True
+    def __post_init__(self) -> None:
+        # Coerce the serialized forms the way the Pydantic model used to
+        if isinstance(self.site, str):
+            self.site = WebsiteState(code=json.loads(self.site))
+        elif isinstance(self.site, dict):
+            self.site = WebsiteState(**self.site)
 
 
-class WebOptObservation(BaseModel):
+@dataclass(kw_only=True, slots=True)
+class WebOptObservation:
     """Observation returned from the environment."""
 
     site: WebsiteState
     reward: float
     done: bool
-
-    class Config:
-        arbitrary_types_allowed = True
\ No newline at end of file
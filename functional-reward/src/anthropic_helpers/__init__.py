@@ -1,13 +1,21 @@
 """Anthropic LLM helper functions with async support and retry logic."""
 
 from .llm import (
+    EPHEMERAL_CACHE,
+    BatchedScorer,
     anthropic_completion,
     anthropic_struct_completion,
     anthropic_multi_completion,
+    get_scorer,
+    image_media_type,
 )
 
 __all__ = [
+    "EPHEMERAL_CACHE",
+    "BatchedScorer",
     "anthropic_completion",
     "anthropic_struct_completion",
     "anthropic_multi_completion",
+    "get_scorer",
+    "image_media_type",
 ]
\ No newline at end of file
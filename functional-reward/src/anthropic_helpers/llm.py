@@ -1,10 +1,19 @@
 """Async Anthropic LLM helper functions with retry logic."""
 
-import base64
+import asyncio
+import functools
+import hashlib
+import json
+import logging
 import os
-from typing import TypeVar
+import time
+import uuid
+import weakref
+from collections import OrderedDict
+from typing import Any, TypeVar
 
 import anthropic
+import httpx
 from pydantic import BaseModel
 from tenacity import (
     retry,
@@ -13,7 +22,49 @@ from tenacity import (
     wait_exponential_jitter,
 )
 
+try:
+    import pybase64 as base64
+except ImportError:  # pragma: no cover - SIMD base64 is an optional speedup
+    import base64
+
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:  # pragma: no cover - HTTP/2 multiplexing is an optional speedup
+    HTTP2_AVAILABLE = False
+
+try:
+    import diskcache
+except ImportError:  # pragma: no cover - persisting the response cache is optional
+    diskcache = None
+
+logger = logging.getLogger(__name__)
+
 MODEL = "claude-sonnet-4-5"
+STRUCTURED_OUTPUTS_BETA = "structured-outputs-2025-11-13"
+
+# Message Batches API limits: flushes below BATCH_MIN_SIZE go through the
+# regular Messages API since the batch queue latency only pays off at scale.
+BATCH_MIN_SIZE = 50
+BATCH_MAX_SIZE = 10000
+BATCH_POLL_INTERVAL = 10.0
+# How long a submission waits for others to join its batch
+BATCH_MAX_WAIT = 0.05
+# Batches still processing after this many seconds are cancelled and raise
+BATCH_MAX_POLL = 600.0
+
+# Upper bound on in-flight Messages API requests per event loop
+MAX_CONCURRENCY = int(os.environ.get("ANTHROPIC_CONCURRENCY", "10"))
+
+# Keep-alive pool shared by every request made through get_client()
+HTTP_LIMITS = httpx.Limits(max_connections=64, max_keepalive_connections=32)
+
+# Prompt-caching breakpoint: the prefix up to a block carrying this marker is
+# served from Anthropic's prompt cache for 5 minutes after each use
+EPHEMERAL_CACHE = {"type": "ephemeral"}
+
+CACHE_TTL = 86400.0
+CACHE_MAX_ENTRIES = 1024
 
 RETRIABLE_EXCEPTIONS = (
     anthropic.RateLimitError,
@@ -23,20 +74,153 @@ RETRIABLE_EXCEPTIONS = (
 
 T = TypeVar("T", bound=BaseModel)
 
-_client: anthropic.AsyncAnthropic | None = None
+# Connection pools and semaphores are bound to the loop that first uses them,
+# so each running loop gets its own; entries go away with their loop
+_clients: weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, anthropic.AsyncAnthropic] = weakref.WeakKeyDictionary()
+_semaphores: weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore] = weakref.WeakKeyDictionary()
 
 
 def get_client() -> anthropic.AsyncAnthropic:
-    """Get or create the async Anthropic client."""
-    global _client
-    if _client is None:
+    """
+    Get or create the async Anthropic client for the running event loop.
+
+    Requests made from the same loop share its keep-alive pool; a new loop
+    (e.g. another asyncio.run) gets a fresh client.
+    """
+    loop = asyncio.get_running_loop()
+    client = _clients.get(loop)
+    if client is None:
         api_key = os.environ.get("ANTHROPIC_API_KEY")
         if not api_key:
             raise ValueError("ANTHROPIC_API_KEY environment variable not set")
-        _client = anthropic.AsyncAnthropic(api_key=api_key)
-    return _client
+        client = _clients[loop] = anthropic.AsyncAnthropic(
+            api_key=api_key,
+            http_client=anthropic.DefaultAsyncHttpxClient(limits=HTTP_LIMITS, http2=HTTP2_AVAILABLE),
+        )
+    return client
+
+
+def _get_semaphore() -> asyncio.Semaphore:
+    """Semaphore capping in-flight requests on the running event loop."""
+    loop = asyncio.get_running_loop()
+    semaphore = _semaphores.get(loop)
+    if semaphore is None:
+        semaphore = _semaphores[loop] = asyncio.Semaphore(MAX_CONCURRENCY)
+    return semaphore
+
+
+class ResponseCache:
+    """
+    Exact-match cache for LLM responses.
+
+    Entries live in an in-process LRU; when ``directory`` is given they are
+    also persisted with ``diskcache`` so repeated rollouts survive restarts.
+    """
+
+    def __init__(
+        self,
+        ttl: float = CACHE_TTL,
+        max_entries: int = CACHE_MAX_ENTRIES,
+        directory: str | None = None,
+    ):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.stats = {"hits": 0, "misses": 0}
+        self._memory: OrderedDict[str, tuple[float, Any]] = OrderedDict()
+        self._disk = None
+        if directory:
+            if diskcache is None:
+                logger.warning("diskcache is not installed; caching responses in memory only, not in %s", directory)
+            else:
+                self._disk = diskcache.Cache(directory)
+
+    def get(self, key: str) -> Any | None:
+        """Return the cached value for key, or None on a miss."""
+        entry = self._memory.get(key)
+        if entry is not None and entry[0] > time.monotonic():
+            self._memory.move_to_end(key)
+            self.stats["hits"] += 1
+            return entry[1]
+
+        if self._disk is not None:
+            value = self._disk.get(key)
+            if value is not None:
+                self._remember(key, value)
+                self.stats["hits"] += 1
+                return value
+
+        self.stats["misses"] += 1
+        return None
+
+    def set(self, key: str, value: Any) -> None:
+        """Store value under key for ``ttl`` seconds."""
+        self._remember(key, value)
+        if self._disk is not None:
+            self._disk.set(key, value, expire=self.ttl)
+
+    def _remember(self, key: str, value: Any) -> None:
+        self._memory[key] = (time.monotonic() + self.ttl, value)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+
+response_cache = ResponseCache(directory=os.environ.get("ANTHROPIC_CACHE_DIR"))
+
+
+def image_media_type(image_bytes: bytes) -> str:
+    """Sniff the media type of encoded image bytes (PNG, JPEG, WebP or GIF)."""
+    if image_bytes[:4] == b"RIFF" and image_bytes[8:12] == b"WEBP":
+        return "image/webp"
+    if image_bytes[:3] == b"\xff\xd8\xff":
+        return "image/jpeg"
+    if image_bytes[:6] in (b"GIF87a", b"GIF89a"):
+        return "image/gif"
+    return "image/png"
+
+
+def _cache_key(name: str, args: tuple, kwargs: dict) -> str:
+    """Hash the model, call name and arguments (image bytes included) into a key."""
+
+    def encode(value):
+        if isinstance(value, (bytes, bytearray, memoryview)):
+            return hashlib.sha256(value).hexdigest()
+        if isinstance(value, type):
+            return f"{value.__module__}.{value.__qualname__}"
+        raise TypeError(f"Cannot build cache key from {type(value).__name__}")
+
+    payload = json.dumps(
+        {"model": MODEL, "call": name, "args": args, "kwargs": kwargs},
+        sort_keys=True,
+        default=encode,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _detached(value: Any) -> Any:
+    """Copy Pydantic results so callers cannot mutate the cached instance."""
+    return value.model_copy(deep=True) if isinstance(value, BaseModel) else value
+
 
+def cached(func):
+    """Serve repeated calls from ``response_cache``; None results are not cached."""
 
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        key = _cache_key(func.__name__, args, kwargs)
+        result = response_cache.get(key)
+        if result is not None:
+            return _detached(result)
+
+        result = await func(*args, **kwargs)
+        if result is not None:
+            response_cache.set(key, result)
+        return _detached(result)
+
+    return wrapper
+
+
+@cached
 @retry(
     stop=stop_after_attempt(3),
     wait=wait_exponential_jitter(initial=1, max=10),
@@ -53,16 +237,18 @@ async def anthropic_completion(messages: list[dict]) -> str | None:
         The text content of the response, or None if empty
     """
     client = get_client()
-    response = await client.messages.create(
-        model=MODEL,
-        max_tokens=1000,
-        messages=messages,
-    )
+    async with _get_semaphore():
+        response = await client.messages.create(
+            model=MODEL,
+            max_tokens=1000,
+            messages=messages,
+        )
     if response.content and response.content[0].type == "text":
         return response.content[0].text
     return None
 
 
+@cached
 @retry(
     stop=stop_after_attempt(3),
     wait=wait_exponential_jitter(initial=1, max=10),
@@ -83,16 +269,18 @@ async def anthropic_struct_completion(
         Parsed output as the specified Pydantic model, or None
     """
     client = get_client()
-    response = await client.beta.messages.parse(
-        model=MODEL,
-        betas=["structured-outputs-2025-11-13"],
-        max_tokens=1024,
-        messages=messages,
-        output_format=output_format,
-    )
+    async with _get_semaphore():
+        response = await client.beta.messages.parse(
+            model=MODEL,
+            betas=[STRUCTURED_OUTPUTS_BETA],
+            max_tokens=1024,
+            messages=messages,
+            output_format=output_format,
+        )
     return response.parsed_output
 
 
+@cached
 @retry(
     stop=stop_after_attempt(3),
     wait=wait_exponential_jitter(initial=1, max=10),
@@ -109,7 +297,7 @@ async def anthropic_multi_completion(
     Args:
         prompt_sys: Optional system prompt
         prompt_user: Optional user prompt text
-        images: Optional list of PNG image bytes (raw bytes, not base64)
+        images: Optional list of PNG, JPEG or WebP image bytes (raw bytes, not base64)
 
     Returns:
         The text content of the response, or None
@@ -120,12 +308,12 @@ async def anthropic_multi_completion(
 
     if images:
         for img_bytes in images:
-            img_b64 = base64.b64encode(img_bytes).decode("utf-8")
+            img_b64 = base64.b64encode(img_bytes).decode("ascii")
             content_blocks.append({
                 "type": "image",
                 "source": {
                     "type": "base64",
-                    "media_type": "image/png",
+                    "media_type": image_media_type(img_bytes),
                     "data": img_b64,
                 },
             })
@@ -148,10 +336,235 @@ async def anthropic_multi_completion(
     }
 
     if prompt_sys:
-        kwargs["system"] = prompt_sys
+        kwargs["system"] = [{
+            "type": "text",
+            "text": prompt_sys,
+            "cache_control": EPHEMERAL_CACHE,
+        }]
 
-    response = await client.messages.create(**kwargs)
+    async with _get_semaphore():
+        response = await client.messages.create(**kwargs)
 
     if response.content and response.content[0].type == "text":
         return response.content[0].text
-    return None
\ No newline at end of file
+    return None
+
+
+def _strict_json_schema(output_format: type[BaseModel]) -> dict:
+    """Build a JSON schema for structured outputs, closing every object type."""
+    schema = output_format.model_json_schema()
+
+    def close(node):
+        if isinstance(node, dict):
+            if node.get("type") == "object":
+                node["additionalProperties"] = False
+            for value in node.values():
+                close(value)
+        elif isinstance(node, list):
+            for value in node:
+                close(value)
+
+    close(schema)
+    return schema
+
+
+class BatchedScorer:
+    """
+    Coalesce structured completions into Message Batches API submissions.
+
+    A request submitted while the scorer is idle is sent straight to the
+    Messages API. Requests arriving while others are in flight are queued:
+    those within ``max_wait`` seconds of the first queued one are flushed
+    together, or sooner once ``max_batch`` requests are waiting. Flushes
+    smaller than ``min_batch`` fall back to concurrent
+    ``anthropic_struct_completion`` calls; larger ones are submitted as a
+    single batch (half the token price) and polled for at most ``max_poll``
+    seconds. Entries that error, expire or time out raise in their caller.
+
+    A scorer binds to the event loop of its first submission; use
+    ``get_scorer()`` for one per running loop.
+
+    Example:
+        >>> scorer = get_scorer()
+        >>> results = await asyncio.gather(*(scorer.submit(m, Model) for m in batch))
+    """
+
+    def __init__(
+        self,
+        max_batch: int = BATCH_MAX_SIZE,
+        min_batch: int = BATCH_MIN_SIZE,
+        poll_interval: float = BATCH_POLL_INTERVAL,
+        max_wait: float = BATCH_MAX_WAIT,
+        max_poll: float = BATCH_MAX_POLL,
+    ):
+        self.max_batch = max_batch
+        self.min_batch = min_batch
+        self.poll_interval = poll_interval
+        self.max_wait = max_wait
+        self.max_poll = max_poll
+        self._pending: list[tuple[str, list[dict], type[BaseModel], asyncio.Future]] = []
+        self._flush_handle: asyncio.Handle | None = None
+        self._in_flight = 0
+        self._loop: asyncio.AbstractEventLoop | None = None
+        # Strong references to running flushes, so none is collected mid-flight
+        self._flush_tasks: set[asyncio.Task] = set()
+
+    async def submit(self, messages: list[dict], output_format: type[T]) -> T | None:
+        """
+        Queue a structured completion and wait for its batch to resolve.
+
+        Args:
+            messages: List of message dicts
+            output_format: A Pydantic BaseModel class defining the output structure
+
+        Returns:
+            Parsed output as the specified Pydantic model, or None
+        """
+        loop = asyncio.get_running_loop()
+        if self._loop is None:
+            self._loop = loop
+        elif self._loop is not loop:
+            raise RuntimeError("BatchedScorer is bound to a different event loop; use get_scorer()")
+
+        if not self._pending and self._in_flight == 0:
+            # Nothing to coalesce with, so don't hold the request for max_wait
+            self._in_flight += 1
+            try:
+                return await anthropic_struct_completion(messages, output_format)
+            finally:
+                self._in_flight -= 1
+
+        future = loop.create_future()
+        self._pending.append((uuid.uuid4().hex, messages, output_format, future))
+        if len(self._pending) >= self.max_batch:
+            if self._flush_handle is not None:
+                self._flush_handle.cancel()
+            self._flush_handle = loop.call_soon(self._start_flush)
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(self.max_wait, self._start_flush)
+        return await future
+
+    def _start_flush(self) -> None:
+        task = self._loop.create_task(self.flush())
+        self._flush_tasks.add(task)
+        task.add_done_callback(self._flush_done)
+
+    def _flush_done(self, task: asyncio.Task) -> None:
+        self._flush_tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.error("BatchedScorer flush failed", exc_info=task.exception())
+
+    async def flush(self) -> None:
+        """Send every queued request, resolving the waiting futures."""
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        batch = []
+        try:
+            while self._pending:
+                batch = self._pending[: self.max_batch]
+                self._pending = self._pending[self.max_batch :]
+
+                self._in_flight += len(batch)
+                try:
+                    if len(batch) < self.min_batch:
+                        results = await asyncio.gather(
+                            *(anthropic_struct_completion(messages, fmt) for _, messages, fmt, _ in batch),
+                            return_exceptions=True,
+                        )
+                    else:
+                        results = await self._run_batch(batch)
+                except Exception as e:
+                    results = [e] * len(batch)
+                finally:
+                    self._in_flight -= len(batch)
+
+                for (_, _, _, future), result in zip(batch, results):
+                    if future.done():
+                        continue
+                    if isinstance(result, BaseException):
+                        future.set_exception(result)
+                    else:
+                        future.set_result(result)
+        finally:
+            # Cancelled or failed outside the per-batch handling: fail every
+            # request still waiting rather than leaving submit() hanging
+            stranded = [entry for entry in batch + self._pending if not entry[3].done()]
+            if stranded:
+                self._pending = []
+                for *_, future in stranded:
+                    future.set_exception(RuntimeError("BatchedScorer flush ended before the request was resolved"))
+
+    async def _run_batch(
+        self,
+        batch: list[tuple[str, list[dict], type[BaseModel], asyncio.Future]],
+    ) -> list[BaseModel | BaseException | None]:
+        """Submit one Message Batch, poll until it ends, and parse its results."""
+        client = get_client()
+        message_batch = await client.beta.messages.batches.create(
+            betas=[STRUCTURED_OUTPUTS_BETA],
+            requests=[
+                {
+                    "custom_id": custom_id,
+                    "params": {
+                        "model": MODEL,
+                        "max_tokens": 1024,
+                        "messages": messages,
+                        "output_format": {
+                            "type": "json_schema",
+                            "schema": _strict_json_schema(output_format),
+                        },
+                    },
+                }
+                for custom_id, messages, output_format, _ in batch
+            ],
+        )
+
+        deadline = time.monotonic() + self.max_poll
+        while message_batch.processing_status != "ended":
+            if time.monotonic() >= deadline:
+                logger.warning("Message batch %s still processing after %.0fs; cancelling", message_batch.id, self.max_poll)
+                await client.beta.messages.batches.cancel(message_batch.id, betas=[STRUCTURED_OUTPUTS_BETA])
+                raise asyncio.TimeoutError(f"Message batch {message_batch.id} did not end within {self.max_poll}s")
+            await asyncio.sleep(self.poll_interval)
+            message_batch = await client.beta.messages.batches.retrieve(
+                message_batch.id,
+                betas=[STRUCTURED_OUTPUTS_BETA],
+            )
+
+        formats = {custom_id: output_format for custom_id, _, output_format, _ in batch}
+        parsed: dict[str, BaseModel | BaseException | None] = {}
+        results = await client.beta.messages.batches.results(
+            message_batch.id,
+            betas=[STRUCTURED_OUTPUTS_BETA],
+        )
+        async for entry in results:
+            if entry.result.type != "succeeded":
+                error = getattr(entry.result, "error", None)
+                logger.warning("Batch request %s %s: %s", entry.custom_id, entry.result.type, error)
+                parsed[entry.custom_id] = RuntimeError(f"Batch request {entry.result.type}: {error}")
+                continue
+            content = entry.result.message.content
+            if content and content[0].type == "text":
+                try:
+                    parsed[entry.custom_id] = formats[entry.custom_id].model_validate_json(content[0].text)
+                except ValueError as e:
+                    parsed[entry.custom_id] = e
+            else:
+                parsed[entry.custom_id] = None
+
+        missing = RuntimeError(f"Message batch {message_batch.id} returned no result for the request")
+        return [parsed.get(custom_id, missing) for custom_id, *_ in batch]
+
+
+# One scorer per running loop: its queue, flush timer and futures belong to that loop
+_scorers: weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, BatchedScorer] = weakref.WeakKeyDictionary()
+
+
+def get_scorer() -> BatchedScorer:
+    """Get or create the shared BatchedScorer for the running event loop."""
+    loop = asyncio.get_running_loop()
+    scorer = _scorers.get(loop)
+    if scorer is None:
+        scorer = _scorers[loop] = BatchedScorer()
+    return scorer
@@ -7,9 +7,14 @@ from pathlib import Path
 
 from pydantic import BaseModel
 
+try:
+    import pybase64 as base64
+except ImportError:  # pragma: no cover - SIMD base64 is an optional speedup
+    import base64
+
 sys.path.insert(0, str(Path(__file__).parent))
 
-from anthropic_helpers import anthropic_multi_completion, anthropic_struct_completion
+from anthropic_helpers import EPHEMERAL_CACHE, BatchedScorer, anthropic_multi_completion, get_scorer, image_media_type
 
 SYSTEM_PROMPT = """You are an expert web page analyzer. Your task is to extract 
 a specification that captures the user-facing functionality of a web page from its screenshot.
@@ -88,30 +93,41 @@ async def generate_spec(image_bytes: bytes) -> str | None:
 async def score_candidate(
     candidate_bytes: bytes,
     specification: str,
+    scoring_prompt: str | None = None,
+    scorer: BatchedScorer | None = None,
 ) -> ScoringResult | None:
-    """Score a candidate image against a specification."""
-    scoring_prompt = build_scoring_prompt(specification)
-
-    # Build messages with image for structured output
+    """Score a candidate image against a specification.
+
+    Callers scoring many candidates against one specification can pass the
+    prompt prebuilt with build_scoring_prompt() to skip rebuilding it.
+    Concurrent calls on one loop share get_scorer() so they coalesce into
+    Message Batches, unless a scorer is passed in.
+    """
+    if scoring_prompt is None:
+        scoring_prompt = build_scoring_prompt(specification)
+
+    # The scoring prompt only changes per episode, so it leads the message as a
+    # cached prefix and the candidate image follows it
     messages = [{
         "role": "user",
         "content": [
+            {
+                "type": "text",
+                "text": scoring_prompt,
+                "cache_control": EPHEMERAL_CACHE,
+            },
             {
                 "type": "image",
                 "source": {
                     "type": "base64",
-                    "media_type": "image/png",
-                    "data": __import__("base64").b64encode(candidate_bytes).decode("utf-8"),
+                    "media_type": image_media_type(candidate_bytes),
+                    "data": base64.b64encode(candidate_bytes).decode("ascii"),
                 },
             },
-            {
-                "type": "text",
-                "text": scoring_prompt,
-            },
         ],
     }]
 
-    return await anthropic_struct_completion(messages, ScoringResult)
+    return await (scorer or get_scorer()).submit(messages, ScoringResult)
 
 
 def format_scores(result: ScoringResult) -> str:
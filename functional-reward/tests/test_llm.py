@@ -1,15 +1,19 @@
 """Tests for Anthropic LLM helper functions."""
 
-import io
+import asyncio
+import functools
 import sys
 from pathlib import Path
+from types import SimpleNamespace
 
 import pytest
 from pydantic import BaseModel
 
 sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
 
+import anthropic_helpers.llm as llm
 from anthropic_helpers import (
+    BatchedScorer,
     anthropic_completion,
     anthropic_multi_completion,
     anthropic_struct_completion,
@@ -23,6 +27,7 @@ class MathResult(BaseModel):
     result_text: str
 
 
+@functools.lru_cache(maxsize=64)
 def create_solid_color_png(r: int, g: int, b: int, size: int = 100) -> bytes:
     """Create a solid color PNG image programmatically without external dependencies."""
     import struct
@@ -42,11 +47,10 @@ def create_solid_color_png(r: int, g: int, b: int, size: int = 100) -> bytes:
     ihdr_data = struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)
     ihdr = png_chunk(b"IHDR", ihdr_data)
 
-    # IDAT chunk (image data)
-    raw_data = b""
-    for _ in range(height):
-        raw_data += b"\x00"  # filter byte
-        raw_data += bytes([r, g, b]) * width
+    # IDAT chunk (image data): every scanline is identical, so build one
+    # (filter byte + pixels) and repeat it in a single allocation
+    row = b"\x00" + bytes((r, g, b)) * width
+    raw_data = row * height
     compressed = zlib.compress(raw_data, 9)
     idat = png_chunk(b"IDAT", compressed)
 
@@ -93,4 +97,205 @@ async def test_image_description():
     )
     assert result is not None
     result_lower = result.lower()
-    assert any(word in result_lower for word in ["blue", "red", "square", "color", "solid"])
\ No newline at end of file
+    assert any(word in result_lower for word in ["blue", "red", "square", "color", "solid"])
+
+
+@pytest.mark.asyncio
+async def test_batched_scorer_small_flush_uses_messages_api(monkeypatch):
+    """Test that flushes below min_batch fall back to per-request completions."""
+    calls = []
+
+    async def fake_struct_completion(messages, output_format):
+        calls.append(messages)
+        return output_format(result_number=len(calls), result_text="ok")
+
+    monkeypatch.setattr(llm, "anthropic_struct_completion", fake_struct_completion)
+
+    scorer = BatchedScorer(min_batch=50)
+    results = await asyncio.gather(*(
+        scorer.submit([{"role": "user", "content": str(i)}], MathResult)
+        for i in range(3)
+    ))
+    assert len(calls) == 3
+    assert sorted(r.result_number for r in results) == [1, 2, 3]
+
+
+@pytest.mark.asyncio
+async def test_batched_scorer_sends_idle_submission_directly(monkeypatch):
+    """Test that a submission with nothing to coalesce with skips the max_wait window."""
+    calls = []
+
+    async def fake_struct_completion(messages, output_format):
+        calls.append(messages)
+        return output_format(result_number=1, result_text="ok")
+
+    monkeypatch.setattr(llm, "anthropic_struct_completion", fake_struct_completion)
+
+    scorer = BatchedScorer(max_wait=10.0)
+    result = await asyncio.wait_for(scorer.submit([{"role": "user", "content": "1"}], MathResult), 1.0)
+    assert result.result_number == 1
+    assert len(calls) == 1
+
+
+@pytest.mark.asyncio
+async def test_batched_scorer_coalesces_within_max_wait(monkeypatch):
+    """Test that submissions arriving while one is in flight share one flush."""
+    flushes = []
+
+    async def slow_struct_completion(messages, output_format):
+        await asyncio.sleep(0.1)
+        return output_format(result_number=-1, result_text="direct")
+
+    async def fake_run_batch(self, batch):
+        flushes.append(len(batch))
+        return [MathResult(result_number=i, result_text="ok") for i in range(len(batch))]
+
+    monkeypatch.setattr(llm, "anthropic_struct_completion", slow_struct_completion)
+    monkeypatch.setattr(BatchedScorer, "_run_batch", fake_run_batch)
+
+    scorer = BatchedScorer(min_batch=1, max_wait=0.05)
+
+    async def delayed_submit(i):
+        await asyncio.sleep(0.01 * i)
+        return await scorer.submit([{"role": "user", "content": str(i)}], MathResult)
+
+    results = await asyncio.gather(*(delayed_submit(i) for i in range(3)))
+    assert flushes == [2]
+    assert results[0].result_text == "direct"
+
+
+def fake_batches_client(processing_status, entries, cancelled):
+    """Build a stand-in client whose Message Batches API returns the given entries."""
+    batch = SimpleNamespace(id="batch-1", processing_status=processing_status)
+
+    async def create(**kwargs):
+        return batch
+
+    async def retrieve(batch_id, **kwargs):
+        return batch
+
+    async def cancel(batch_id, **kwargs):
+        cancelled.append(batch_id)
+
+    async def results(batch_id, **kwargs):
+        async def iterate():
+            for entry in entries:
+                yield entry
+        return iterate()
+
+    batches = SimpleNamespace(create=create, retrieve=retrieve, cancel=cancel, results=results)
+    return SimpleNamespace(beta=SimpleNamespace(messages=SimpleNamespace(batches=batches)))
+
+
+@pytest.mark.asyncio
+async def test_batched_scorer_raises_for_errored_entries(monkeypatch):
+    """Test that errored batch entries raise in their caller instead of becoming None."""
+    entries = [
+        SimpleNamespace(custom_id="req-1", result=SimpleNamespace(type="errored", error="overloaded")),
+    ]
+    monkeypatch.setattr(llm, "get_client", lambda: fake_batches_client("ended", entries, []))
+
+    scorer = BatchedScorer(min_batch=1)
+    # req-2 has no entry at all, which must not pass silently either
+    batch = [("req-1", [], MathResult, None), ("req-2", [], MathResult, None)]
+    results = await scorer._run_batch(batch)
+    assert all(isinstance(result, RuntimeError) for result in results)
+
+
+@pytest.mark.asyncio
+async def test_batched_scorer_cancels_batches_past_max_poll(monkeypatch):
+    """Test that a batch still processing after max_poll is cancelled and raises."""
+    cancelled = []
+    monkeypatch.setattr(llm, "get_client", lambda: fake_batches_client("in_progress", [], cancelled))
+
+    scorer = BatchedScorer(min_batch=1, poll_interval=0.01, max_poll=0.05)
+    with pytest.raises(asyncio.TimeoutError):
+        await scorer._run_batch([("req-1", [], MathResult, None)])
+    assert cancelled == ["batch-1"]
+
+
+@pytest.mark.asyncio
+async def test_cached_serves_repeated_calls(monkeypatch):
+    """Test that identical calls (including image bytes) hit the response cache."""
+    monkeypatch.setattr(llm, "response_cache", llm.ResponseCache())
+    calls = []
+
+    @llm.cached
+    async def fake_completion(prompt_user=None, images=None):
+        calls.append(prompt_user)
+        return f"response {len(calls)}"
+
+    png = create_solid_color_png(0, 0, 255)
+    first = await fake_completion(prompt_user="describe", images=[png])
+    second = await fake_completion(prompt_user="describe", images=[png])
+    other = await fake_completion(prompt_user="describe", images=[create_solid_color_png(255, 0, 0)])
+
+    assert first == second == "response 1"
+    assert other == "response 2"
+    assert llm.response_cache.stats == {"hits": 1, "misses": 2}
+
+
+@pytest.mark.asyncio
+async def test_cached_returns_independent_models(monkeypatch):
+    """Test that cached Pydantic results are copies, so callers cannot corrupt the cache."""
+    monkeypatch.setattr(llm, "response_cache", llm.ResponseCache())
+
+    @llm.cached
+    async def fake_struct(prompt_user=None):
+        return MathResult(result_number=4, result_text="four")
+
+    first = await fake_struct(prompt_user="2+2")
+    first.result_number = 5
+    second = await fake_struct(prompt_user="2+2")
+
+    assert second.result_number == 4
+    assert second is not first
+
+
+def test_response_cache_without_diskcache_stays_in_memory(monkeypatch, tmp_path):
+    """Test that a cache directory without diskcache installed degrades to memory only."""
+    monkeypatch.setattr(llm, "diskcache", None)
+    cache = llm.ResponseCache(directory=str(tmp_path))
+    cache.set("key", "value")
+    assert cache.get("key") == "value"
+
+
+def test_client_and_semaphore_are_per_loop(monkeypatch):
+    """Test that each event loop gets its own client and concurrency semaphore."""
+    monkeypatch.setenv("ANTHROPIC_API_KEY", "test-key")
+
+    async def grab():
+        return llm.get_client(), llm._get_semaphore(), llm.get_client(), llm._get_semaphore()
+
+    first = asyncio.run(grab())
+    second = asyncio.run(grab())
+
+    assert first[0] is first[2] and first[1] is first[3]
+    assert first[0] is not second[0]
+    assert first[1] is not second[1]
+
+
+@pytest.mark.asyncio
+async def test_batched_scorer_fails_requests_of_a_cancelled_flush(monkeypatch):
+    """Test that a flush cancelled mid-batch fails its waiting requests instead of hanging them."""
+    started = asyncio.Event()
+
+    async def stuck_struct_completion(messages, output_format):
+        started.set()
+        await asyncio.sleep(3600)
+
+    monkeypatch.setattr(llm, "anthropic_struct_completion", stuck_struct_completion)
+
+    scorer = BatchedScorer(max_wait=0.01)
+    first = asyncio.ensure_future(scorer.submit([{"role": "user", "content": "1"}], MathResult))
+    await started.wait()
+    queued = asyncio.ensure_future(scorer.submit([{"role": "user", "content": "2"}], MathResult))
+    while not scorer._flush_tasks:
+        await asyncio.sleep(0.005)
+
+    for task in list(scorer._flush_tasks):
+        task.cancel()
+    with pytest.raises(RuntimeError):
+        await asyncio.wait_for(queued, 1.0)
+    assert not scorer._flush_tasks
+    first.cancel()
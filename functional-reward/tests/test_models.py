@@ -0,0 +1,28 @@
+"""Tests for the WebOpt environment data models."""
+
+import json
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from models import WebOptAction, WebsiteState
+
+CODE = {"/project/src/index.html": "<h1>hi</h1>", "/project/src/app.js": "console.log(1)"}
+
+
+def test_action_accepts_website_state():
+    site = WebsiteState(code=CODE)
+    assert WebOptAction(site=site).site is site
+
+
+def test_action_coerces_dict_site():
+    action = WebOptAction(site={"code": CODE})
+    assert isinstance(action.site, WebsiteState)
+    assert action.site.code == CODE
+
+
+def test_action_coerces_json_site():
+    action = WebOptAction(site=json.dumps(CODE))
+    assert isinstance(action.site, WebsiteState)
+    assert action.site.code == CODE
@@ -12,21 +12,46 @@ Perfect for testing web performance optimization.
 """
 
 import asyncio
-import base64
+import hashlib
 import io
-import json
-from concurrent.futures import ThreadPoolExecutor
+import logging
+import math
+import os
+import socket
+import tempfile
+import threading
+import zipfile
+from collections import OrderedDict, deque
+from collections.abc import Iterable
 from uuid import uuid4
 
 import numpy as np
-from mcp import ClientSession
-from mcp.client.stdio import StdioServerParameters, stdio_client
+try:
+    from numba import njit
+except ImportError:  # pragma: no cover - the JIT-compiled PSNR kernel is an optional speedup
+    njit = None
+from mcp.client.stdio import StdioServerParameters
 from PIL import Image
-from skimage.metrics import peak_signal_noise_ratio
 
 from openenv_core.env_server.interfaces import Environment
+from web_opt.server.bank_tools import BUILD_DIRS, BankManager, directory_signature, iter_files, write_texts
 
-from .bank_tools import BankManager
+try:
+    import pybase64 as base64
+except ImportError:  # pragma: no cover - SIMD base64 is an optional speedup
+    import base64
+
+try:
+    from orjson import loads as json_loads
+except ImportError:  # pragma: no cover - orjson is an optional speedup
+    from json import loads as json_loads
+
+try:
+    import imagehash
+except ImportError:  # pragma: no cover - semantic spec-score cache is optional
+    imagehash = None
+
+from .mcp_session import PersistentMCPSession
 from .models import (
     LighthouseScores,
     VerificationScores,
@@ -35,10 +60,191 @@ from .models import (
     WebOptState,
     WebsiteState,
 )
+from .src.generate_and_score import build_scoring_prompt, generate_spec, score_candidate
+
+logger = logging.getLogger(__name__)
+
+if imagehash is None:  # pragma: no cover - depends on the installed extras
+    logger.warning("imagehash is not installed: the spec-score cache and reference-match gate are disabled")
 
 LOCAL = False
 LOCAL_PATH = "/Users/axcel/Documents/IterateHackathon/WebOptEnv/web_opt/lighthouse/dist/index.js"
 
+# Each environment owns an MCP server process serving its deployment on its
+# own port, so several environments in one process audit in parallel. Ports
+# come from the OS rather than a counter, so concurrent worker processes do not
+# collide; the ones handed out here are tracked until close() releases them.
+_ports_in_use: set[int] = set()
+_ports_lock = threading.Lock()
+
+
+def _allocate_port() -> int:
+    """Reserve a TCP port that is currently free for an environment's deployment."""
+    with _ports_lock:
+        while True:
+            with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+                sock.bind(("", 0))
+                port = sock.getsockname()[1]
+            if port not in _ports_in_use:
+                _ports_in_use.add(port)
+                return port
+
+
+def _release_port(port: int) -> None:
+    """Return a port reserved by _allocate_port()."""
+    with _ports_lock:
+        _ports_in_use.discard(port)
+
+# Number of zipped project snapshots kept in memory, keyed by directory signature
+ZIP_CACHE_SIZE = 8
+
+# Number of audits (scores + screenshot) kept in memory, keyed by project code
+AUDIT_CACHE_SIZE = 32
+
+# Timestamp stamped on every archive member (the earliest zip allows)
+ZIP_DATE_TIME = (1980, 1, 1, 0, 0, 0)
+# The MCP server is a local child process, so archives are handed over as a
+# file on tmpfs instead of as base64 inside the JSON-RPC message
+ARCHIVE_DIR = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+
+# Only these category scores feed the reward; the audit skips the rest and
+# returns just the scores instead of the full report
+AUDIT_CATEGORIES = ["performance", "accessibility", "best-practices", "seo"]
+
+# Audit and screenshot run concurrently after deployment; set
+# WEBOPT_SERIAL_AUDIT=1 to run them one after the other if the screenshot's
+# browser noticeably skews Lighthouse's performance measurements
+SERIAL_AUDIT = os.environ.get("WEBOPT_SERIAL_AUDIT") == "1"
+
+# Archives are stored uncompressed by default: they only cross tmpfs to the
+# local MCP server, which unpacks them right away, so deflate is pure CPU
+# cost. Set WEBOPT_ZIP_DEFLATE=1 to compress them with level 1 deflate.
+ZIP_COMPRESSION = zipfile.ZIP_DEFLATED if os.environ.get("WEBOPT_ZIP_DEFLATE") == "1" else zipfile.ZIP_STORED
+
+# PSNR compares box-filtered screenshots shrunk by this factor on each axis.
+# That touches 1/16 of the pixels, and the pooled signal still tracks
+# layout and colour changes. Set it to 1 to compare at full resolution.
+PSNR_POOL_FACTOR = 4
+
+# Candidates whose perceptual hash is within this Hamming distance of an
+# already-scored screenshot reuse its specification score.
+SPEC_CACHE_MAX_DISTANCE = 4
+# Scored screenshots kept per episode for that lookup (oldest dropped first)
+SPEC_CACHE_MAX_ENTRIES = 64
+
+# Candidates at least this close to the reference (PSNR in dB, phash Hamming
+# distance) render the reference and get its specification score.
+SPEC_SKIP_MIN_PSNR = 40.0
+SPEC_SKIP_MAX_DISTANCE = 2
+
+# Specification score of the reference itself: it meets every criterion
+REFERENCE_SPEC_SCORE = 1.0
+
+# Screenshots are re-encoded as lossy WebP before being sent to Claude:
+# several times smaller than PNG, so less upload and fewer image tokens.
+LLM_IMAGE_FORMAT = "WEBP"
+LLM_IMAGE_QUALITY = 80
+# Longest edge Claude processes without internal downscaling; larger
+# screenshots only cost more vision tokens.
+LLM_IMAGE_MAX_EDGE = 1092
+
+
+# One long-lived loop drives every synchronous entrypoint, so the shared
+# Anthropic client keeps its connection pool (and TLS sessions) across calls.
+_LOOP = asyncio.new_event_loop()
+threading.Thread(target=_LOOP.run_forever, name="webopt-loop", daemon=True).start()
+
+
+def _run_sync(coro):
+    """Run a coroutine to completion on the shared background loop."""
+    return asyncio.run_coroutine_threadsafe(coro, _LOOP).result()
+
+
+async def _on_loop(coro):
+    """Await a coroutine on the shared background loop from any event loop."""
+    if asyncio.get_running_loop() is _LOOP:
+        return await coro
+    return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(coro, _LOOP))
+
+
+def _content_hash(content: str) -> bytes:
+    """Digest used to detect whether a file's content changed."""
+    return hashlib.blake2b(content.encode(), digest_size=16).digest()
+
+
+def _pool(screenshot: Image.Image) -> Image.Image:
+    """Box-filter downsample by PSNR_POOL_FACTOR (done in C by Pillow)."""
+    return screenshot.reduce(PSNR_POOL_FACTOR) if PSNR_POOL_FACTOR > 1 else screenshot
+
+
+def _reference_array(screenshot: Image.Image | None) -> np.ndarray | None:
+    """Contiguous uint8 pixels of the pooled reference screenshot, converted once per episode."""
+    if screenshot is None:
+        return None
+    array = np.ascontiguousarray(_pool(screenshot), dtype=np.uint8)
+    # Shared across every step of the episode; guard it against in-place edits
+    array.flags.writeable = False
+    return array
+
+
+if njit is not None:
+    @njit(cache=True, nogil=True)
+    def _sum_squared_diff(a: np.ndarray, b: np.ndarray) -> int:
+        """Exact sum of squared differences of two flat uint8 arrays, in one pass."""
+        total = 0
+        for i in range(a.size):
+            d = np.int32(a[i]) - np.int32(b[i])
+            total += d * d
+        return total
+else:
+    def _sum_squared_diff(a: np.ndarray, b: np.ndarray) -> int:
+        """Exact sum of squared differences of two flat uint8 arrays."""
+        # uint8 differences fit in int16 and their squares in int32; summing
+        # into int64 keeps it exact while touching half the bytes of an int32 diff
+        diff = np.subtract(a, b, dtype=np.int16)
+        return np.square(diff, dtype=np.int32).sum(dtype=np.int64)
+
+
+def _psnr(screen: Image.Image | None, reference_array: np.ndarray | None) -> float:
+    """PSNR of a pooled screenshot against the pooled reference array, clipped to [0, 100]."""
+    if screen is None or reference_array is None:
+        return 0
+
+    screen = _pool(screen)
+    reference_size = (reference_array.shape[1], reference_array.shape[0])
+    if screen.size != reference_size:
+        screen = screen.resize(reference_size, Image.Resampling.NEAREST)
+
+    screen_array = np.ascontiguousarray(screen, dtype=np.uint8)
+    if screen_array.shape != reference_array.shape:
+        raise ValueError(f"Screenshot shape {screen_array.shape} does not match reference {reference_array.shape}")
+    mse = _sum_squared_diff(screen_array.ravel(), reference_array.ravel()) / reference_array.size
+    if mse == 0:
+        return 100.0
+    return min(max(10.0 * math.log10(65025.0 / mse), 0.0), 100.0)
+
+
+def _phash(screenshot: Image.Image | None):
+    """Perceptual hash of screenshot, or None without imagehash or a screenshot."""
+    if imagehash is None or screenshot is None:
+        return None
+    return imagehash.phash(screenshot)
+
+
+def _compare_to_reference(screenshot: Image.Image | None, reference_array: np.ndarray | None) -> tuple:
+    """PSNR against the reference and the candidate's phash, computed together off the loop."""
+    return _psnr(screenshot, reference_array), _phash(screenshot)
+
+
+def _decode_screenshot(image_data: str) -> Image.Image:
+    """Decode the base64 PNG of a capture_screenshot result into a fully loaded image."""
+    # Tell Pillow the format instead of probing every registered plugin
+    screenshot = Image.open(io.BytesIO(base64.b64decode(image_data)), formats=("PNG",))
+    # Decode now rather than lazily inside the PSNR comparison. The image stays
+    # at full resolution; only _encode_for_llm downscales its copy.
+    screenshot.load()
+    return screenshot
+
 
 class WebOptEnvironment(Environment):
     """
@@ -59,10 +265,26 @@ class WebOptEnvironment(Environment):
             command="node",
             args=["/app/mcp/dist/index.js" if not LOCAL else LOCAL_PATH],
         )
+        # One MCP server process serves every deploy/audit/screenshot call
+        self._mcp = PersistentMCPSession(self.server_params)
+        self._port = _allocate_port()
         self._state = None
         self._reset_count = -1
         self._bank_manager = BankManager()
         self._project = None
+        self._zip_cache: OrderedDict[bytes, bytes] = OrderedDict()
+        self._archive_path = os.path.join(ARCHIVE_DIR, f"webopt-{os.getpid()}-{self._port}.zip")
+        # Content hash of every project file as last written, to skip no-op writes
+        self._file_hashes: dict[str, bytes] = {}
+        self._deployed = False
+        # Audit results keyed by _content_key(), and files written since the last
+        # deployment because their audit came from the cache
+        self._audit_cache: OrderedDict[bytes, tuple] = OrderedDict()
+        self._undeployed: set[str] = set()
+        self._spec_score_cache: deque[tuple] = deque(maxlen=SPEC_CACHE_MAX_ENTRIES)
+        # (screenshot, reference array, scores) of the last verification; a
+        # repeated action gets the same cached screenshot object back
+        self._last_verification: tuple | None = None
         self.reset()
 
     def reset(self) -> WebOptObservation:
@@ -72,24 +294,38 @@ class WebOptEnvironment(Environment):
         Returns:
             WebOptObservation with initial state
         """
-        self._project = self._bank_manager.sample_project()
-        project_path = self._project.path
-        print(f"Temporal project path: {project_path}")
+        return _run_sync(self._reset_async())
+
+    async def reset_async(self) -> WebOptObservation:
+        """
+        Async variant of reset().
 
-        site = WebsiteState(code=self._project.get_state())
+        Can be awaited from any event loop: the work runs on the environment's
+        shared loop (see _run_sync), which owns the Anthropic connection pool.
+        Several environments can be reset concurrently with asyncio.gather.
+        """
+        return await _on_loop(self._reset_async())
 
-        # Zip the project directory and get base64 encoded string
-        zip_base64 = self._zip_directory_to_base64(project_path)
+    async def _reset_async(self) -> WebOptObservation:
+        self._project = await asyncio.to_thread(self._bank_manager.sample_project)
+        project_path = self._project.path
+        logger.debug("Temporal project path: %s", project_path)
 
-        # Get Lighthouse scores using the zipped project
-        lighthouse_scores, screenshot = self._get_lighthouse_scores(zip_base64)
+        # File system work runs off the loop so concurrent environments overlap
+        site = WebsiteState(code=await asyncio.to_thread(self._project.get_state))
+        self._file_hashes = {path: _content_hash(content) for path, content in site.code.items()}
+
+        # Get Lighthouse scores for a fresh deployment of the project
+        self._deployed = False
+        lighthouse_scores, screenshot = await self._get_lighthouse_scores_async(project_path)
 
         # Generate specification from reference screenshot
-        reference_spec = self._generate_specification(screenshot)
+        reference_spec = await self._generate_specification_async(screenshot)
         if reference_spec:
-            print(f"Generated specification ({len(reference_spec)} chars)")
+            logger.debug("Generated specification (%d chars)", len(reference_spec))
         else:
-            print("Warning: Failed to generate specification")
+            logger.warning("Failed to generate specification")
+        self._spec_score_cache.clear()
 
         self._state = WebOptState(
             site=site,
@@ -99,9 +335,16 @@ class WebOptEnvironment(Environment):
             accessibility_scores=[lighthouse_scores.accessibility_score],
             seo_scores=[lighthouse_scores.seo_score],
             practices_scores=[lighthouse_scores.practices_score],
+            last_performance=lighthouse_scores.performance_score,
+            last_accessibility=lighthouse_scores.accessibility_score,
+            last_seo=lighthouse_scores.seo_score,
+            last_practices=lighthouse_scores.practices_score,
             project_path=project_path,
             reference_screenshot=screenshot,
+            reference_array=_reference_array(screenshot),
+            reference_phash=await asyncio.to_thread(_phash, screenshot),
             reference_spec=reference_spec,
+            reference_scoring_prompt=build_scoring_prompt(reference_spec) if reference_spec else None,
         )
 
         self._reset_count += 1
@@ -112,46 +355,107 @@ class WebOptEnvironment(Environment):
             done=False,
         )
 
-    def _zip_directory_to_base64(self, directory_path: str) -> str:
-        """Zip a directory and return it as a base64 encoded string."""
-        import os
-        import shutil
-        import tempfile
+    def _archive_directory(self, directory_path: str) -> str:
+        """Zip a whole directory into the archive file handed to the MCP server."""
+        return self._write_archive(self._zip_directory(directory_path))
 
-        temp_dir = tempfile.mkdtemp()
-        try:
-            zip_path = os.path.join(temp_dir, "project.zip")
-            shutil.make_archive(os.path.join(temp_dir, "project"), "zip", directory_path)
+    def _archive_files(self, file_paths: Iterable[str], directory_path: str) -> str:
+        """Zip the given files into the archive file handed to the MCP server."""
+        return self._write_archive(self._zip_files(file_paths, directory_path))
 
-            with open(zip_path, "rb") as f:
-                zip_binary = f.read()
-                return base64.b64encode(zip_binary).decode("utf-8")
-        finally:
-            shutil.rmtree(temp_dir, ignore_errors=True)
+    def _write_archive(self, data: bytes) -> str:
+        """Write zip bytes to this environment's archive file and return its path."""
+        with open(self._archive_path, "wb") as f:
+            f.write(data)
+        return self._archive_path
 
-    def _update_local_project_from_action(self, action: WebOptAction, project_path: str) -> None:
-        """Update the local project from the action."""
+    def _zip_directory(self, directory_path: str) -> bytes:
+        """Zip a directory and return the archive bytes.
+
+        Results are cached on a signature of every file's path, mtime and size,
+        so re-zipping an unchanged project is a dictionary lookup.
+        """
+        signature = directory_signature(directory_path, BUILD_DIRS)
+        zip_bytes = self._zip_cache.get(signature)
+        if zip_bytes is not None:
+            self._zip_cache.move_to_end(signature)
+            return zip_bytes
+
+        zip_bytes = self._zip_directory_uncached(directory_path)
+        self._zip_cache[signature] = zip_bytes
+        if len(self._zip_cache) > ZIP_CACHE_SIZE:
+            self._zip_cache.popitem(last=False)
+        return zip_bytes
+
+    def _zip_directory_uncached(self, directory_path: str) -> bytes:
+        """Zip a directory in memory and return the archive bytes."""
+        return self._zip_files((entry.path for entry in iter_files(directory_path, BUILD_DIRS)), directory_path)
+
+    def _zip_files(self, file_paths: Iterable[str], directory_path: str) -> bytes:
+        """Zip the given files, with paths relative to directory_path, in memory."""
+        buffer = io.BytesIO()
+        # No compression by default, level 1 deflate otherwise; see ZIP_COMPRESSION
+        with zipfile.ZipFile(buffer, "w", ZIP_COMPRESSION, compresslevel=1) as zf:
+            for file_path in file_paths:
+                with open(file_path, "rb") as f:
+                    data = f.read()
+                # Prebuilt header with a fixed timestamp: no stat per file, and
+                # identical trees produce identical archives
+                info = zipfile.ZipInfo(os.path.relpath(file_path, directory_path), date_time=ZIP_DATE_TIME)
+                info.compress_type = ZIP_COMPRESSION
+                info.external_attr = 0o644 << 16
+                zf.writestr(info, data, compresslevel=1)
+
+        return buffer.getvalue()
+
+    def _update_local_project_from_action(self, action: WebOptAction, project_path: str) -> list[str]:
+        """Update the local project from the action, returning the paths that changed."""
         code_dict = action.site.code
 
-        for file in code_dict:
-            with open(file, "w") as f:
-                f.write(code_dict[file])
+        written, hashes = {}, {}
+        for file, content in code_dict.items():
+            content_hash = _content_hash(content)
+            if self._file_hashes.get(file) == content_hash:
+                continue
+            written[file] = content
+            hashes[file] = content_hash
+        write_texts(written)
+        # Only remember the hashes once the files are actually on disk
+        self._file_hashes.update(hashes)
+        return list(written)
 
     def step(self, action: WebOptAction) -> WebOptObservation:
-        if isinstance(action.site, str):
-            code_dict = json.loads(action.site)
-            action = WebOptAction(site=WebsiteState(code=code_dict))
+        return _run_sync(self._step_async(action))
 
-        project_path = self._project.path
+    async def step_async(self, action: WebOptAction) -> WebOptObservation:
+        """
+        Async variant of step().
 
-        self._update_local_project_from_action(action, project_path)
-        self._state.site = WebsiteState(code=self._project.get_state())
+        Can be awaited from any event loop: the work runs on the environment's
+        shared loop (see _run_sync), and several environments can step
+        concurrently with asyncio.gather.
+        """
+        return await _on_loop(self._step_async(action))
+
+    async def _step_async(self, action: WebOptAction) -> WebOptObservation:
+        """
+        Apply the action, audit the deployment and score the result.
+
+        The Lighthouse audit runs first since it produces the candidate
+        screenshot, which is then verified against the reference.
+        """
+        project_path = self._project.path
 
-        zip_base64 = self._zip_directory_to_base64(project_path)
+        changed = await asyncio.to_thread(self._update_local_project_from_action, action, project_path)
+        # Only the changed files differ from disk, so merge them instead of rescanning src
+        self._state.site = WebsiteState(code=self._project.merge_state(
+            self._state.site.code, {file: action.site.code[file] for file in changed}
+        ))
 
-        lighthouse_scores, screenshot = self._get_lighthouse_scores(zip_base64)
-        verification_scores = self._run_verification_audit(screenshot)
-        print("Verification scores:", verification_scores)
+        # Only the changed files are shipped to the live deployment
+        lighthouse_scores, screenshot = await self._get_lighthouse_scores_async(project_path, changed)
+        verification_scores = await self._run_verification_audit_async(screenshot)
+        logger.debug("Verification scores: %s", verification_scores)
 
         reward = self._estimate_reward(lighthouse_scores, verification_scores)
 
@@ -159,6 +463,10 @@ class WebOptEnvironment(Environment):
         self._state.accessibility_scores.append(lighthouse_scores.accessibility_score)
         self._state.seo_scores.append(lighthouse_scores.seo_score)
         self._state.practices_scores.append(lighthouse_scores.practices_score)
+        self._state.last_performance = lighthouse_scores.performance_score
+        self._state.last_accessibility = lighthouse_scores.accessibility_score
+        self._state.last_seo = lighthouse_scores.seo_score
+        self._state.last_practices = lighthouse_scores.practices_score
 
         self._state.step_count += 1
 
@@ -170,10 +478,10 @@ class WebOptEnvironment(Environment):
 
     def _estimate_reward(self, scores: LighthouseScores, verification: VerificationScores) -> float:
         """Estimate the reward based on the Lighthouse scores."""
-        prev_accessibility_score = self._state.accessibility_scores[-1]
-        prev_seo_score = self._state.seo_scores[-1]
-        prev_practices_score = self._state.practices_scores[-1]
-        prev_performance_score = self._state.performance_scores[-1]
+        prev_accessibility_score = self._state.last_accessibility
+        prev_seo_score = self._state.last_seo
+        prev_practices_score = self._state.last_practices
+        prev_performance_score = self._state.last_performance
 
         # PSNR score normalized to [0, 1]
         psnr_score = verification.psnr_score / 100
@@ -184,17 +492,30 @@ class WebOptEnvironment(Environment):
         # Combined visual fidelity: both PSNR and specification must be good
         visual_fidelity = psnr_score * spec_score
 
-        reward = np.mean([
-            scores.performance_score - prev_performance_score,
-            scores.accessibility_score - prev_accessibility_score,
-            scores.seo_score - prev_seo_score,
-            scores.practices_score - prev_practices_score,
-        ])
+        # Mean of four deltas in plain Python: np.mean's array setup costs far
+        # more than the arithmetic and would return an np.float64
+        reward = (
+            (scores.performance_score - prev_performance_score)
+            + (scores.accessibility_score - prev_accessibility_score)
+            + (scores.seo_score - prev_seo_score)
+            + (scores.practices_score - prev_practices_score)
+        ) / 4
 
         reward = reward * visual_fidelity
 
         return reward
 
+    def close(self) -> None:
+        """Shut down the persistent MCP server session and remove temporary files."""
+        self._mcp.close()
+        _release_port(self._port)
+        if self._project is not None:
+            self._project.cleanup()
+        try:
+            os.remove(self._archive_path)
+        except FileNotFoundError:
+            pass
+
     @property
     def state(self) -> WebOptState:
         """
@@ -205,6 +526,16 @@ class WebOptEnvironment(Environment):
         """
         return self._state
 
+    @staticmethod
+    def _encode_for_llm(screenshot: Image.Image) -> bytes:
+        """Encode a screenshot as compact lossy WebP bytes for the LLM."""
+        image = screenshot.convert("RGB")
+        image.thumbnail((LLM_IMAGE_MAX_EDGE, LLM_IMAGE_MAX_EDGE), Image.Resampling.LANCZOS)
+
+        buffer = io.BytesIO()
+        image.save(buffer, format=LLM_IMAGE_FORMAT, quality=LLM_IMAGE_QUALITY, method=4)
+        return buffer.getvalue()
+
     def _generate_specification(self, screenshot: Image.Image | None) -> str | None:
         """
         Generate specification from reference screenshot using Anthropic LLM.
@@ -215,26 +546,14 @@ class WebOptEnvironment(Environment):
         Returns:
             Specification text with rubriques for scoring, or None if failed
         """
+        return _run_sync(self._generate_specification_async(screenshot))
+
+    async def _generate_specification_async(self, screenshot: Image.Image | None) -> str | None:
+        """Async variant of _generate_specification()."""
         if screenshot is None:
             return None
 
-        async def run_async():
-            from src.generate_and_score import generate_spec
-
-            # Convert PIL Image to PNG bytes
-            buffer = io.BytesIO()
-            screenshot.save(buffer, format="PNG")
-            image_bytes = buffer.getvalue()
-
-            return await generate_spec(image_bytes)
-
-        try:
-            loop = asyncio.get_running_loop()
-            with ThreadPoolExecutor(max_workers=1) as executor:
-                future = executor.submit(asyncio.run, run_async())
-                return future.result()
-        except RuntimeError:
-            return asyncio.run(run_async())
+        return await generate_spec(await asyncio.to_thread(self._encode_for_llm, screenshot))
 
     def _score_against_specification(self, screenshot: Image.Image | None) -> float:
         """
@@ -246,105 +565,172 @@ class WebOptEnvironment(Environment):
         Returns:
             Normalized score [0, 1] representing how well the candidate matches the spec
         """
+        return _run_sync(self._score_against_specification_async(screenshot))
+
+    async def _score_against_specification_async(self, screenshot: Image.Image | None, candidate_hash=None) -> float:
+        """Async variant of _score_against_specification(), backed by the phash cache.
+
+        Pass candidate_hash when the screenshot's phash is already known.
+        """
         if screenshot is None or not self._state.reference_spec:
             return 0.0
 
-        async def run_async():
-            from src.generate_and_score import score_candidate
+        if candidate_hash is None:
+            candidate_hash = await asyncio.to_thread(_phash, screenshot)
+        if candidate_hash is not None:
+            for cached_hash, cached_score in self._spec_score_cache:
+                if candidate_hash - cached_hash <= SPEC_CACHE_MAX_DISTANCE:
+                    return cached_score
+
+        candidate_bytes = await asyncio.to_thread(self._encode_for_llm, screenshot)
+        result = await score_candidate(
+            candidate_bytes,
+            self._state.reference_spec,
+            scoring_prompt=self._state.reference_scoring_prompt,
+        )
 
-            # Convert PIL Image to PNG bytes
-            buffer = io.BytesIO()
-            screenshot.save(buffer, format="PNG")
-            candidate_bytes = buffer.getvalue()
+        # Normalize: total_score / number_of_criteria
+        if result is None or len(result.criteria) == 0:
+            spec_score = 0.0
+        else:
+            spec_score = result.total_score / len(result.criteria)
 
-            result = await score_candidate(candidate_bytes, self._state.reference_spec)
-            if result is None:
-                return 0.0
+        if candidate_hash is not None:
+            self._spec_score_cache.append((candidate_hash, spec_score))
+        return spec_score
 
-            # Normalize: total_score / number_of_criteria
-            if len(result.criteria) == 0:
-                return 0.0
-            return result.total_score / len(result.criteria)
+    async def _deploy_project_async(self, project_path: str, changed: list[str] | None = None) -> None:
+        """
+        Deploy the project to the MCP server.
 
-        try:
-            loop = asyncio.get_running_loop()
-            with ThreadPoolExecutor(max_workers=1) as executor:
-                future = executor.submit(asyncio.run, run_async())
-                return future.result()
-        except RuntimeError:
-            return asyncio.run(run_async())
+        Args:
+            project_path: Root directory of the project
+            changed: Files changed since the last deployment; when given and a
+                deployment is live, only these are patched onto it
+        """
+        if changed is not None and self._deployed:
+            if not changed:
+                return
+            patch_path = await asyncio.to_thread(self._archive_files, changed, project_path)
+            patch_result = await self._mcp.call_tool_async(
+                "apply_patch",
+                arguments={"zip_path": patch_path},
+            )
+            if not patch_result.isError:
+                return
+
+        zip_path = await asyncio.to_thread(self._archive_directory, project_path)
+        deploy_result = await self._mcp.call_tool_async(
+            "deploy_zip",
+            arguments={
+                "zip_path": zip_path,
+                "port": self._port,
+            },
+        )
+        self._deployed = not deploy_result.isError
 
-    def _run_lighthouse_audit(self, zip_base64: str) -> dict:
-        """Run Lighthouse audit on the deployed zip.
+    def _run_lighthouse_audit(self, project_path: str, changed: list[str] | None = None) -> dict:
+        """Deploy the project and run a Lighthouse audit on it.
 
         Args:
-            zip_base64: Base64 encoded zip content of the project
+            project_path: Root directory of the project
+            changed: Files changed since the last deployment, see _deploy_project_async()
 
         Returns:
             Dictionary containing the audit scores
         """
-
-        async def run_async():
-            async with stdio_client(self.server_params) as (read, write):
-                async with ClientSession(read, write) as session:
-                    await session.initialize()
-
-                    await session.call_tool(
-                        "deploy_zip",
-                        arguments={
-                            "zip_content": zip_base64,
-                            "port": 8080,
-                        },
-                    )
-
-                    audit_result = await session.call_tool(
-                        "audit_with_lighthouse",
-                        arguments={},
-                    )
-
-                    screenshot = await session.call_tool(
-                        "capture_screenshot",
-                        arguments={
-                            "url": "http://localhost:8080",
-                            "width": 1280,
-                            "height": 800,
-                        },
-                    )
-                    screenshot_text = screenshot.content[0].text
-                    screenshot_result = json.loads(screenshot_text)["screenshot"]
-                    image_data = screenshot_result.replace("data:image/png;base64,", "")
-
-                    png_bytes = base64.b64decode(image_data)
-                    buffer = io.BytesIO(png_bytes)
-                    screenshot_img = Image.open(buffer)
-
-                    if audit_result and audit_result.content:
-                        content_text = audit_result.content[0].text
-                        result = json.loads(content_text)
-                        result["screenshot"] = screenshot_img
-                        return result
-                    return {}
-
-        try:
-            loop = asyncio.get_running_loop()
-            with ThreadPoolExecutor(max_workers=1) as executor:
-                future = executor.submit(asyncio.run, run_async())
-                return future.result()
-        except RuntimeError:
-            return asyncio.run(run_async())
-
-    def _get_lighthouse_scores(self, zip_base64: str) -> tuple[LighthouseScores, Image.Image | None]:
+        return _run_sync(self._run_lighthouse_audit_async(project_path, changed))
+
+    async def _run_lighthouse_audit_async(self, project_path: str, changed: list[str] | None = None) -> dict:
+        """Async variant of _run_lighthouse_audit()."""
+        await self._deploy_project_async(project_path, changed)
+
+        audit_call = ("audit_with_lighthouse", {
+            "categories": AUDIT_CATEGORIES,
+            "scores_only": True,
+        })
+        screenshot_call = ("capture_screenshot", {
+            "url": f"http://localhost:{self._port}",
+            "width": 1280,
+            "height": 800,
+        })
+        if SERIAL_AUDIT:
+            audit_result = await self._mcp.call_tool_async(*audit_call)
+            screenshot = await self._mcp.call_tool_async(*screenshot_call)
+        else:
+            audit_result, screenshot = await self._mcp.call_tools_async(audit_call, screenshot_call)
+        # PNG decode and resize are CPU-bound; keep them off the shared loop
+        screenshot_img = await asyncio.to_thread(_decode_screenshot, screenshot.content[0].data)
+
+        if audit_result and audit_result.content:
+            content_text = audit_result.content[0].text
+            result = json_loads(content_text)
+            result["screenshot"] = screenshot_img
+            return result
+        return {}
+
+    def _get_lighthouse_scores(
+        self, project_path: str, changed: list[str] | None = None
+    ) -> tuple[LighthouseScores, Image.Image | None]:
         """Get Lighthouse scores for the given site.
 
         Args:
-            zip_base64: Base64 encoded zip content of the project
+            project_path: Root directory of the project
+            changed: Files changed since the last deployment, see _deploy_project_async()
 
         Returns:
             Tuple of LighthouseScores and screenshot Image
         """
+        return _run_sync(self._get_lighthouse_scores_async(project_path, changed))
+
+    def _content_key(self) -> bytes:
+        """Hash the current project and the content of its code files."""
+        h = hashlib.blake2b(digest_size=16)
+        h.update(self._project.name.encode())
+        # Paths relative to the working copy, which moves every episode
+        root_len = len(self._project.path)
+        for path, content_hash in sorted(self._file_hashes.items()):
+            h.update(path[root_len:].encode())
+            h.update(content_hash)
+        return h.digest()
+
+    async def _get_lighthouse_scores_async(
+        self, project_path: str, changed: list[str] | None = None
+    ) -> tuple[LighthouseScores, Image.Image | None]:
+        """
+        Async variant of _get_lighthouse_scores().
+
+        Audits are cached on the project's code content, so revisiting an
+        already audited state skips the deploy and audit entirely.
+        """
+        key = self._content_key()
+        cached = self._audit_cache.get(key)
+        if cached is not None:
+            self._audit_cache.move_to_end(key)
+            # The live deployment still lacks these; they go out with the next patch
+            self._undeployed.update(changed or ())
+            return cached
+
+        if changed is not None:
+            changed = sorted(self._undeployed.union(changed))
+        self._undeployed.clear()
+
+        scores, screenshot = await self._audit_project_async(project_path, changed)
+        if screenshot is None:
+            self._undeployed.update(changed or ())
+        else:
+            self._audit_cache[key] = (scores, screenshot)
+            if len(self._audit_cache) > AUDIT_CACHE_SIZE:
+                self._audit_cache.popitem(last=False)
+        return scores, screenshot
+
+    async def _audit_project_async(
+        self, project_path: str, changed: list[str] | None = None
+    ) -> tuple[LighthouseScores, Image.Image | None]:
+        """Deploy and audit the project, returning default scores if that fails."""
         try:
-            audit_result = self._run_lighthouse_audit(zip_base64)
-            print(audit_result)
+            audit_result = await self._run_lighthouse_audit_async(project_path, changed)
+            logger.debug("Audit result: %s", audit_result)
 
             if audit_result.get("success"):
                 scores = audit_result.get("audit", {}).get("scores", {})
@@ -358,7 +744,7 @@ class WebOptEnvironment(Environment):
                     audit_result["screenshot"],
                 )
         except Exception as e:
-            print(f"Error running Lighthouse audit: {e}")
+            logger.warning("Error running Lighthouse audit: %s", e)
 
         return (
             LighthouseScores(
@@ -372,22 +758,48 @@ class WebOptEnvironment(Environment):
 
     def _run_verification_audit(self, new_screenshot: Image.Image | None) -> VerificationScores:
         """Run verification audit comparing new screenshot to reference."""
+        return _run_sync(self._run_verification_audit_async(new_screenshot))
 
-        def psnr(screen, reference):
-            if screen is None or reference is None:
-                return 0
-            psnr_score = peak_signal_noise_ratio(
-                np.array(screen.resize(reference.size)),
-                np.array(reference),
+    async def _run_verification_audit_async(self, new_screenshot: Image.Image | None) -> VerificationScores:
+        """Async variant of _run_verification_audit().
+
+        PSNR and the candidate's phash are computed once in a worker thread.
+        Screenshots visually indistinguishable from the reference get the
+        reference's specification score; only the others go on to spec scoring,
+        so no paid LLM request is started for a reference match.
+        """
+        if new_screenshot is not None and new_screenshot is self._state.reference_screenshot:
+            # An audit-cache hit on the reference code hands back the reference
+            # image itself: nothing to compare, hash or re-score
+            return VerificationScores(
+                psnr_score=100.0,
+                isomorphism_score=0,
+                specification_score=REFERENCE_SPEC_SCORE,
             )
-            psnr_score = np.clip(psnr_score, 0, 100)
-            return psnr_score
 
-        psnr_val = psnr(new_screenshot, self._state.reference_screenshot)
-        spec_score = self._score_against_specification(new_screenshot)
+        last = self._last_verification
+        if new_screenshot is not None and last is not None and last[0] is new_screenshot and last[1] is self._state.reference_array:
+            # Same cached screenshot as the previous step: PSNR, hash and spec score are unchanged
+            return last[2]
 
-        return VerificationScores(
+        psnr_val, candidate_hash = await asyncio.to_thread(
+            _compare_to_reference, new_screenshot, self._state.reference_array
+        )
+        if self._matches_reference(psnr_val, candidate_hash):
+            spec_score = REFERENCE_SPEC_SCORE
+        else:
+            spec_score = await self._score_against_specification_async(new_screenshot, candidate_hash)
+
+        scores = VerificationScores(
             psnr_score=psnr_val,
             isomorphism_score=0,
             specification_score=spec_score,
-        )
\ No newline at end of file
+        )
+        self._last_verification = (new_screenshot, self._state.reference_array, scores)
+        return scores
+
+    def _matches_reference(self, psnr_val: float, candidate_hash) -> bool:
+        """Whether a candidate matches the reference closely enough to skip spec scoring."""
+        if candidate_hash is None or psnr_val <= SPEC_SKIP_MIN_PSNR or self._state.reference_phash is None:
+            return False
+        return candidate_hash - self._state.reference_phash <= SPEC_SKIP_MAX_DISTANCE
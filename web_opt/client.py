@@ -13,8 +13,30 @@ over HTTP.
 
 from typing import Any, Dict, Optional
 from io import BytesIO
-import base64
+import binascii
 from PIL import Image
+import httpx
+
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:  # pragma: no cover - HTTP/2 multiplexing is an optional speedup
+    HTTP2_AVAILABLE = False
+
+try:
+    import orjson
+
+    def _dumps(obj: Any) -> bytes:
+        return orjson.dumps(obj)
+
+    _loads = orjson.loads
+except ImportError:  # pragma: no cover - orjson is an optional speedup
+    import json
+
+    def _dumps(obj: Any) -> bytes:
+        return json.dumps(obj).encode("utf-8")
+
+    _loads = json.loads
 
 from openenv_core.client_types import StepResult
 from openenv_core.env_server.types import State
@@ -22,6 +44,10 @@ from openenv_core.http_env_client import HTTPEnvClient
 
 from .models import WebOptAction, WebOptObservation, WebsiteState, WebOptState
 
+HTTP_LIMITS = httpx.Limits(max_connections=64, max_keepalive_connections=64)
+# Retries cover failed connection attempts only, so a step is never sent twice
+HTTP_CONNECT_RETRIES = 3
+
 
 class WebOptEnv(HTTPEnvClient[WebOptAction, WebOptObservation]):
     """
@@ -56,6 +82,48 @@ class WebOptEnv(HTTPEnvClient[WebOptAction, WebOptObservation]):
         provider: Optional["ContainerProvider"] = None,
     ):
         super().__init__(base_url, request_timeout_s, default_headers, provider)
+        # One pooled keep-alive client (HTTP/2 when h2 is installed) so
+        # concurrent rollouts share connections instead of reconnecting.
+        self._http.close()
+        self._http = httpx.Client(
+            transport=httpx.HTTPTransport(limits=HTTP_LIMITS, http2=HTTP2_AVAILABLE, retries=HTTP_CONNECT_RETRIES)
+        )
+
+    def reset(self) -> StepResult[WebOptObservation]:
+        return self._parse_result(self._post("/reset", {}))
+
+    def step(self, action: WebOptAction) -> StepResult[WebOptObservation]:
+        body: Dict[str, Any] = {
+            "action": self._step_payload(action),
+            "timeout_s": int(self._timeout),
+        }
+        return self._parse_result(self._post("/step", body))
+
+    def state(self) -> WebOptState:
+        r = self._http.get(f"{self._base}/state", headers=self._headers, timeout=self._timeout)
+        r.raise_for_status()
+        return self._parse_state(_loads(r.content))
+
+    def _post(self, path: str, body: Dict[str, Any]) -> Dict:
+        """
+        POST a JSON body and decode the JSON response.
+
+        Observations carry the whole site code, so encoding and decoding go
+        through orjson (when installed) rather than the stdlib json module;
+        state() decodes its response the same way.
+        """
+        r = self._http.post(
+            f"{self._base}{path}",
+            content=_dumps(body),
+            headers={"Content-Type": "application/json", **self._headers},
+            timeout=self._timeout,
+        )
+        r.raise_for_status()
+        return _loads(r.content)
+
+    def close(self) -> None:
+        self._http.close()
+        super().close()
 
     def _step_payload(self, action: WebOptAction) -> Dict:
         """
@@ -129,7 +197,10 @@ class WebOptEnv(HTTPEnvClient[WebOptAction, WebOptObservation]):
         screenshot_data = payload.get("reference_screenshot")
         screenshot = None
         if screenshot_data:
-            screenshot = Image.open(BytesIO(base64.b64decode(screenshot_data)))
+            # a2b_base64 takes the ASCII str as-is, skipping b64decode's wrapper checks
+            screenshot = Image.open(BytesIO(binascii.a2b_base64(screenshot_data)))
+            # Decode now so the response buffer can be released
+            screenshot.load()
         
         return WebOptState(
             site=site,
@@ -140,5 +211,9 @@ class WebOptEnv(HTTPEnvClient[WebOptAction, WebOptObservation]):
             performance_scores=payload.get("performance_scores", []),
             accessibility_scores=payload.get("accessibility_scores", []),
             seo_scores=payload.get("seo_scores", []),
-            practices_scores=payload.get("practices_scores", [])
+            practices_scores=payload.get("practices_scores", []),
+            last_performance=payload.get("last_performance", 0.0),
+            last_accessibility=payload.get("last_accessibility", 0.0),
+            last_seo=payload.get("last_seo", 0.0),
+            last_practices=payload.get("last_practices", 0.0),
         )
\ No newline at end of file
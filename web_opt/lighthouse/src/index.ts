@@ -12,11 +12,13 @@ import path from "path";
 import { fileURLToPath } from "url";
 import lighthouse from "lighthouse";
 import * as chromeLauncher from "chrome-launcher";
-import { exec } from "child_process";
+import { exec, execFile } from "child_process";
 import { promisify } from "util";
 import puppeteer from 'puppeteer-core';
 
 const execAsync = promisify(exec);
+// Takes an argument array and runs without a shell, so paths need no quoting
+const execFileAsync = promisify(execFile);
 
 const __filename = fileURLToPath(import.meta.url);
 const __dirname = path.dirname(__filename);
@@ -24,12 +26,18 @@ const __dirname = path.dirname(__filename);
 const TEMP_DIR = path.join(__dirname, "../temp");
 const DEFAULT_PORT = 8080;
 
+// Patched files outside src/ and public/ that never reach the built output
+// (docs, licence files, directory entries); a patch made only of these
+// skips the rebuild
+const NO_BUILD_FILE = /^(?!(src|public)\/)(.*\/|.*\.md|(.*\/)?(LICENSE|CHANGELOG)(\.[^/]*)?)$/i;
+
 class WebOptEnvServer {
   private server: Server;
   private expressApp: Express | null = null;
   private expressServer: any = null;
   private currentPort: number = DEFAULT_PORT;
   private currentHtmlFile: string | null = null;
+  private currentAppPath: string | null = null;
 
   constructor() {
     this.server = new Server(
@@ -62,20 +70,41 @@ class WebOptEnvServer {
         {
           name: "deploy_zip",
           description:
-            "Accept a base64-encoded zip file, extract it, and serve the application. Automatically detects and handles Node.js projects or static sites.",
+            "Accept a zip file (base64-encoded or as a local path), extract it, and serve the application. Automatically detects and handles Node.js projects or static sites.",
           inputSchema: {
             type: "object",
             properties: {
               zip_content: {
                 type: "string",
-                description: "Base64-encoded zip file content",
+                description: "Base64-encoded zip file content (required unless zip_path is given)",
+              },
+              zip_path: {
+                type: "string",
+                description: "Path to a zip file readable by the server, used instead of zip_content",
               },
               port: {
                 type: "number",
                 description: `Optional port number (defaults to ${DEFAULT_PORT})`,
               },
             },
-            required: ["zip_content"],
+          },
+        },
+        {
+          name: "apply_patch",
+          description:
+            "Apply a zip of changed files (base64-encoded or as a local path) onto the current deploy_zip deployment and rebuild it in place, skipping npm install unless package.json changed.",
+          inputSchema: {
+            type: "object",
+            properties: {
+              zip_content: {
+                type: "string",
+                description: "Base64-encoded zip holding only the changed files, with paths relative to the project root (required unless zip_path is given)",
+              },
+              zip_path: {
+                type: "string",
+                description: "Path to such a zip file readable by the server, used instead of zip_content",
+              },
+            },
           },
         },
         {
@@ -121,6 +150,11 @@ class WebOptEnvServer {
                 description:
                   "Lighthouse categories to audit (defaults to all)",
               },
+              scores_only: {
+                type: "boolean",
+                description:
+                  "Return only the category scores as compact JSON, omitting metrics, opportunities and diagnostics (default: false)",
+              },
             },
           },
         },
@@ -134,7 +168,7 @@ class WebOptEnvServer {
         },
         {
           name: "capture_screenshot",
-          description: "Capture a screenshot of a given URL and return it as a base64-encoded PNG.",
+          description: "Capture a screenshot of a given URL and return it as a PNG image content item, followed by a text item with its dimensions.",
           inputSchema: {
             type: "object",
             properties: {
@@ -161,6 +195,8 @@ class WebOptEnvServer {
       switch (request.params.name) {
         case "deploy_zip":
           return await this.handleDeployZip(request.params.arguments);
+        case "apply_patch":
+          return await this.handleApplyPatch(request.params.arguments);
         case "serve_html":
           return await this.handleServeHtml(request.params.arguments);
         case "audit_with_lighthouse":
@@ -175,12 +211,29 @@ class WebOptEnvServer {
     });
   }
 
+  /**
+   * Return the path of the zip described by args: zip_path as is, or
+   * zip_content decoded from base64 and written to tempPath.
+   */
+  private async resolveZip(args: any, tempPath: string): Promise<string> {
+    if (args.zip_path) {
+      console.error(`[Zip] Using zip file at: ${args.zip_path}`);
+      return args.zip_path as string;
+    }
+    if (!args.zip_content) {
+      throw new Error("Either zip_content or zip_path is required.");
+    }
+    const zipBuffer = Buffer.from(args.zip_content as string, "base64");
+    await fs.writeFile(tempPath, zipBuffer);
+    console.error(`[Zip] Zip file written to ${tempPath}, size: ${zipBuffer.length} bytes`);
+    return tempPath;
+  }
+
   private async handleDeployZip(args: any) {
     console.error('[DeployZip] Starting deployment process');
     try {
-      const zipContent = args.zip_content as string;
       const port = (args.port as number) || DEFAULT_PORT;
-      console.error(`[DeployZip] Port: ${port}, Zip content size: ${zipContent.length} bytes`);
+      console.error(`[DeployZip] Port: ${port}`);
 
       // Stop existing server if running
       if (this.expressServer) {
@@ -192,16 +245,13 @@ class WebOptEnvServer {
       console.error(`[DeployZip] Creating deployment directory: ${deployDir}`);
       await fs.mkdir(deployDir, { recursive: true });
 
-      // Save zip file to temp location
-      const zipPath = path.join(deployDir, "deploy.zip");
-      const zipBuffer = Buffer.from(zipContent, "base64");
-      console.error(`[DeployZip] Writing zip file to: ${zipPath}`);
-      await fs.writeFile(zipPath, zipBuffer);
-      console.error(`[DeployZip] Zip file written, size: ${zipBuffer.length} bytes`);
+      // Extract straight from zip_path when given; otherwise save the
+      // base64 content to a temp location first
+      const zipPath = await this.resolveZip(args, path.join(deployDir, "deploy.zip"));
 
       // Unzip the file
       console.error(`[DeployZip] Extracting zip file`);
-      await execAsync(`unzip -q ${zipPath} -d ${deployDir}`);
+      await execFileAsync("unzip", ["-q", zipPath, "-d", deployDir]);
       console.error(`[DeployZip] Zip extraction complete`);
 
       // Find the root directory (assuming the zip contains a single directory)
@@ -269,6 +319,7 @@ class WebOptEnvServer {
           reject(err);
         });
       });
+      this.currentAppPath = appPath;
       console.error(`[DeployZip] Deployment complete and server running`);
 
       return {
@@ -314,6 +365,74 @@ class WebOptEnvServer {
     }
   }
 
+  private async handleApplyPatch(args: any) {
+    console.error('[ApplyPatch] Starting patch');
+    try {
+      if (!this.currentAppPath || !this.expressServer) {
+        throw new Error("No deployment to patch. Please deploy first using deploy_zip.");
+      }
+      const appPath = this.currentAppPath;
+
+      const tempPatchPath = path.join(appPath, `patch-${Date.now()}.zip`);
+      const patchPath = await this.resolveZip(args, tempPatchPath);
+      let needsBuild = true;
+      try {
+        const { stdout } = await execFileAsync("unzip", ["-Z1", patchPath]);
+        const changedFiles = stdout.split("\n").filter((name) => name.length > 0);
+        console.error(`[ApplyPatch] Changed files: ${changedFiles.join(', ')}`);
+        needsBuild = changedFiles.some((name) => !NO_BUILD_FILE.test(name));
+        await execFileAsync("unzip", ["-o", "-q", patchPath, "-d", appPath]);
+
+        if (changedFiles.some((name) => path.basename(name).startsWith("package"))) {
+          console.error(`[ApplyPatch] Package manifest changed, installing dependencies...`);
+          await execAsync('npm install', { cwd: appPath });
+        }
+      } finally {
+        if (patchPath === tempPatchPath) {
+          await fs.unlink(patchPath);
+        }
+      }
+
+      // express.static reads from dist on every request, so rebuilding in
+      // place is enough; the running server keeps serving the new output.
+      if (needsBuild) {
+        console.error(`[ApplyPatch] Rebuilding application...`);
+        const buildStart = Date.now();
+        await execAsync('npm run build', { cwd: appPath });
+        console.error(`[ApplyPatch] Build completed in ${Date.now() - buildStart}ms`);
+      } else {
+        console.error(`[ApplyPatch] No built files changed, skipping rebuild`);
+      }
+
+      return {
+        content: [
+          {
+            type: "text",
+            text: JSON.stringify({
+              success: true,
+              port: this.currentPort,
+            }),
+          },
+        ],
+      };
+    } catch (error: any) {
+      console.error(`[ApplyPatch] ERROR: Patch failed: ${error instanceof Error ? error.message : String(error)}`);
+      return {
+        content: [
+          {
+            type: "text",
+            text: JSON.stringify({
+              success: false,
+              error: error instanceof Error ? error.message : String(error),
+              stderr: error.stderr || "",
+            }),
+          },
+        ],
+        isError: true,
+      };
+    }
+  }
+
   private async handleServeHtml(args: any) {
     try {
       const htmlContent = args.html_content as string;
@@ -409,6 +528,7 @@ class WebOptEnvServer {
         "seo",
         "pwa",
       ];
+      const scoresOnly = Boolean(args.scores_only);
       console.error(`[Lighthouse] Audit categories: ${categories.join(', ')}`);
 
       // Launch Chrome and run Lighthouse
@@ -457,6 +577,21 @@ class WebOptEnvServer {
         };
       }
 
+      if (scoresOnly) {
+        console.error('[Lighthouse] Returning category scores only');
+        return {
+          content: [
+            {
+              type: "text",
+              text: JSON.stringify({
+                success: true,
+                audit: { url: url, scores: results.scores },
+              }),
+            },
+          ],
+        };
+      }
+
       // Collect performance metrics if available
       if (report.audits) {
         const metricsToExtract = [
@@ -594,16 +729,24 @@ class WebOptEnvServer {
           console.error(`[Screenshot] Page dimensions: ${pageWidth}x${pageHeight}`);
           console.error('[Screenshot] Screenshot capture complete');
 
+          // The PNG goes out as an image content item so clients read the
+          // base64 data directly instead of JSON-parsing it out of text
           return {
-            content: [{
-              type: 'text',
-              text: JSON.stringify({
-                success: true,
-                screenshot: `data:image/png;base64,${screenshot}`,
-                width: pageWidth,
-                height: pageHeight
-              })
-            }]
+            content: [
+              {
+                type: 'image',
+                data: screenshot,
+                mimeType: 'image/png'
+              },
+              {
+                type: 'text',
+                text: JSON.stringify({
+                  success: true,
+                  width: pageWidth,
+                  height: pageHeight
+                })
+              }
+            ]
           };
         } finally {
           console.error('[Screenshot] Disconnecting browser...');
@@ -686,6 +829,7 @@ class WebOptEnvServer {
       });
       this.expressServer = null;
       this.expressApp = null;
+      this.currentAppPath = null;
       console.error('[StopServer] Express server references cleared');
     }
 
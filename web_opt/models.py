@@ -11,6 +11,7 @@ The web_opt environment is a web optimization environment that uses Lighthouse a
 """
 
 from dataclasses import dataclass
+from typing import Any
 
 from openenv_core.env_server.types import Action, Observation, State
 from PIL import Image
@@ -38,13 +39,20 @@ class WebOptState(State):
     site: WebsiteState
     project_path: str
     reference_screenshot: Image
+    reference_array: Any | None = None  # pooled np.ndarray of reference_screenshot, cached for PSNR
 
     performance_scores: list
     accessibility_scores: list
     seo_scores: list
     practices_scores: list
 
-@dataclass(kw_only=True)
+    # Latest scores, the baseline for the next step's reward
+    last_performance: float = 0.0
+    last_accessibility: float = 0.0
+    last_seo: float = 0.0
+    last_practices: float = 0.0
+
+@dataclass(kw_only=True, slots=True)
 class LighthouseScores:
     performance_score: float
     accessibility_score: float
@@ -52,7 +60,7 @@ class LighthouseScores:
     practices_score: float
 
 
-@dataclass(kw_only=True)
+@dataclass(kw_only=True, slots=True)
 class VerificationScores:
     psnr_score: float
     isomorphism_score: float
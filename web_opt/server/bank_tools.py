@@ -1,83 +1,220 @@
-from os import listdir
+import functools
 import logging
+import hashlib
 import random
+import shutil
+import struct
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
 
 
 import os
 
+# Directories never descended into when walking a project: installed
+# dependencies, VCS metadata and tool caches. Hidden directories are skipped
+# as well.
+PRUNE_DIRS = {"node_modules", ".git", ".next", ".cache"}
+
+# Build output at the root of a project, which the MCP server rebuilds. Only
+# pruned at the top level, so source directories that happen to share these
+# names (e.g. src/build/) are kept.
+BUILD_DIRS = frozenset({"dist", "build"})
+
+# Source file extensions folder_to_state exposes to the agent
+CODE_EXTENSIONS = frozenset({"js", "ts", "tsx", "jsx", "css", "html"})
+
+# Upper bound on concurrent file reads in folder_to_state and writes in write_texts
+READ_WORKERS = 16
+
+# Shared by every read and write; threads are only started as work is submitted
+_IO_EXECUTOR = ThreadPoolExecutor(max_workers=READ_WORKERS, thread_name_prefix="webopt-io")
+
+
+def _sorted_entries(path: str) -> list:
+    """Return the entries of a directory sorted by name, or [] if it is gone."""
+    try:
+        with os.scandir(path) as it:
+            return sorted(it, key=lambda entry: entry.name)
+    except FileNotFoundError:
+        return []
+
+
+def iter_files(root_path: str, prune_top_level: frozenset[str] = frozenset()):
+    """
+    Yield a DirEntry for every file under root_path, depth-first in name order.
+
+    Uses an explicit stack of os.scandir iterators instead of recursion, so the
+    file type comes from the directory listing rather than an extra stat call.
+    Directories in PRUNE_DIRS and hidden directories are not descended into,
+    nor are directories in prune_top_level directly under root_path.
+    """
+    stack = [iter(_sorted_entries(root_path))]
+    while stack:
+        entry = next(stack[-1], None)
+        if entry is None:
+            stack.pop()
+        elif entry.is_dir(follow_symlinks=False):
+            if len(stack) == 1 and entry.name in prune_top_level:
+                continue
+            if entry.name not in PRUNE_DIRS and not entry.name.startswith("."):
+                stack.append(iter(_sorted_entries(entry.path)))
+        elif entry.is_file():
+            yield entry
+
+
+def directory_signature(root_path: str, prune_top_level: frozenset[str] = frozenset()) -> bytes:
+    """Hash the path relative to root_path, mtime and size of every file iter_files() yields."""
+    h = hashlib.blake2b(digest_size=16)
+    prefix = len(root_path)
+    for entry in iter_files(root_path, prune_top_level):
+        st = entry.stat()
+        h.update(entry.path[prefix:].encode())
+        h.update(struct.pack("<qQ", st.st_mtime_ns, st.st_size))
+    return h.digest()
+
+
+def _read_text(path: str) -> str | None:
+    """Read a file as UTF-8 text, or None if it cannot be read."""
+    # One bulk decode of the raw bytes is cheaper than a text-mode stream
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+    except OSError:
+        return None
+    return data.decode("utf-8", errors="replace")
+
+
+def _is_code_file(name: str) -> bool:
+    return "." in name and name.rpartition(".")[2].lower() in CODE_EXTENSIONS
+
+
+def _read_texts(paths: list[str]) -> list[str | None]:
+    """Read several files as UTF-8 text, in parallel; None for unreadable ones."""
+    if len(paths) < 2:
+        return [_read_text(path) for path in paths]
+    # Reads release the GIL, so a small pool overlaps their I/O stalls
+    return list(_IO_EXECUTOR.map(_read_text, paths))
+
+
+def _write_text(item: tuple[str, str]) -> None:
+    path, content = item
+    # Encode once and write the bytes, matching the UTF-8 decode in _read_text
+    with open(path, "wb") as f:
+        f.write(content.encode("utf-8"))
+
+
+def write_texts(files: dict[str, str]) -> None:
+    """Write several files as UTF-8 text, in parallel when there is more than one."""
+    if len(files) < 2:
+        for item in files.items():
+            _write_text(item)
+        return
+    list(_IO_EXECUTOR.map(_write_text, files.items()))
+
+
 def folder_to_state(root_path: str) -> dict:
     """
     DFS over all files under root_path and return a dictionary where keys are file names and values are file contents.
     """
-    state = {}
-
-    def dfs(path: str):
-        # List entries in deterministic order
-        try:
-            entries = sorted(os.listdir(path))
-        except FileNotFoundError:
-            return
-
-        for name in entries:
-            full = os.path.join(path, name)
-            filename, file_extension = os.path.splitext(full)
-            if os.path.isdir(full):
-                # Recurse into subdirectory
-                dfs(full)
-            elif os.path.isfile(full) and file_extension[1:].lower() in ['js', 'ts', 'tsx', 'jsx', 'css', 'html']:
-                # Read file content as text
-                try:
-                    with open(full, "r", encoding="utf-8", errors="replace") as f:
-                        content = f.read()
-                except OSError:
-                    # Skip unreadable files
-                    continue
-
-                # Use just the filename as the tag (e.g. "style.css", "index.html")
-                tag = full
-                state[tag] = content
-
-    dfs(root_path)
-    return state
+    paths = [entry.path for entry in iter_files(root_path) if _is_code_file(entry.name)]
+    # Key on the full path so the action can write the file back; skip unreadable files
+    return {path: content for path, content in zip(paths, _read_texts(paths)) if content is not None}
+
+
+# Bank src directory -> (directory_signature, {path relative to src: content}).
+# Shared by every Project, so resampling a project skips re-reading its files.
+_bank_states: dict[str, tuple[bytes, dict[str, str]]] = {}
 
 
 class Project:
     def __init__(self, path: str, root: str):
-        self.path = os.path.join(root, path)
-        self.path = self._copy_project_to_temp(self)
-    
-    def _copy_project_to_temp(self, project) -> str:
-        """Copy project from bank to a temp directory and return the path."""
-        import shutil
-        import tempfile
-        import os
-        
-        # Create or clean the current_project directory
-        temp_dir = os.path.join(tempfile.gettempdir(), "current_project")
-        
-        # Remove existing directory if it exists
-        if os.path.exists(temp_dir):
-            shutil.rmtree(temp_dir)
-        
-        # Create the directory
-        os.makedirs(temp_dir, exist_ok=True)
-        
-        # Copy the project files
-        shutil.copytree(project.path, temp_dir, dirs_exist_ok=True)
-        
-        return temp_dir
+        self.name = path
+        self.src_path = os.path.join(root, path)
+        # Working copy the episode edits; created by materialize()
+        self.path = None
+
+    def materialize(self) -> str:
+        """Copy the project from the bank into a fresh temp directory and return its path."""
+        self.cleanup()
+        self.path = tempfile.mkdtemp(prefix="webopt_project_")
+        # Pruned directories never reach the deploy archive, so skip copying them.
+        # Files are copied rather than hard-linked: episodes rewrite them in place.
+        shutil.copytree(self.src_path, self.path, dirs_exist_ok=True, ignore=self._ignore_pruned)
+        return self.path
+
+    def _ignore_pruned(self, directory: str, names: list[str]) -> set[str]:
+        """copytree ignore callback mirroring the pruning of iter_files(src_path, BUILD_DIRS)."""
+        top_level = directory == self.src_path
+        return {name for name in names if name in PRUNE_DIRS or (top_level and name in BUILD_DIRS)}
+
+    def cleanup(self) -> None:
+        """Remove the working copy, if any."""
+        if self.path is not None:
+            shutil.rmtree(self.path, ignore_errors=True)
+            self.path = None
 
     def validate(self) -> bool:
         return True
 
+    def tracks(self, path: str) -> bool:
+        """Whether get_state() would include the file at path."""
+        return path.startswith(os.path.join(self.path, "src", "")) and _is_code_file(os.path.basename(path))
+
+    def merge_state(self, code: dict, written: dict) -> dict:
+        """Return code updated with the written files get_state() would include, without rescanning."""
+        code = dict(code)
+        for path, content in written.items():
+            if self.tracks(path):
+                code[path] = content
+        return code
+
     def get_state(self) -> dict:
-        return folder_to_state(os.path.join(self.path, 'src'))
+        """
+        Return the working copy's source files, keyed on their full path.
+
+        materialize() preserves mtimes, so an untouched copy has the same
+        signature as the bank and its contents come from _bank_states;
+        anything else is read from disk. Steps keep the state current
+        through merge_state() instead.
+        """
+        src_path = os.path.join(self.path, 'src')
+        bank_src_path = os.path.join(self.src_path, 'src')
+        signature = directory_signature(src_path)
+        cached = _bank_states.get(bank_src_path)
+        if cached is not None and cached[0] == signature:
+            files = cached[1]
+        else:
+            files = {path[len(src_path):]: content for path, content in folder_to_state(src_path).items()}
+            if signature == directory_signature(bank_src_path):
+                _bank_states[bank_src_path] = (signature, files)
+        return {src_path + relative: content for relative, content in files.items()}
+
+
+@functools.lru_cache(maxsize=4)
+def _discover_projects(bank_root: str, mtime_ns: int) -> tuple[str, ...]:
+    """
+    Names of the project directories in bank_root.
+
+    Cached per process, so environments created after the first reuse the
+    scan; mtime_ns is part of the key so adding or removing a project
+    invalidates it.
+    """
+    # A single readdir pass; skips .DS_Store and other hidden entries as
+    # well as stray files without an extra stat per entry
+    with os.scandir(bank_root) as it:
+        return tuple(
+            entry.name
+            for entry in it
+            if not entry.name.startswith(".") and entry.is_dir(follow_symlinks=False)
+        )
 
 
 class BankManager:
     def __init__(self):
         self._bank_root = os.path.join(os.path.dirname(__file__), "website_bank/")
-        self._all_projects = [Project(path, root=self._bank_root) for path in listdir(self._bank_root) if path != ".DS_Store"]
+        # Projects hold per-episode state, so each manager gets its own objects
+        names = _discover_projects(self._bank_root, os.stat(self._bank_root).st_mtime_ns)
+        self._all_projects = [Project(name, root=self._bank_root) for name in names]
         logging.info(f"Found {len(self._all_projects)} projects in {self._bank_root}")
 
         self.projects = []
@@ -87,6 +224,12 @@ class BankManager:
                 valid_projects += 1
                 self.projects.append(project)
         logging.info(f"Valid projects: {valid_projects}")
-    
+        self._current: Project | None = None
+
     def sample_project(self) -> Project:
-        return random.choice(self.projects)
\ No newline at end of file
+        """Pick a random project and give it a fresh working copy, dropping the previous one."""
+        if self._current is not None:
+            self._current.cleanup()
+        self._current = random.choice(self.projects)
+        self._current.materialize()
+        return self._current
\ No newline at end of file